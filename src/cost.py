@@ -0,0 +1,106 @@
+''' Attributes the cost of inference to the expressions that caused it.
+
+Every rule and every unit of solver work is charged to one registered
+expression: the earliest registered of the IDs it mentions. Expressions
+are registered before their children, so this is the innermost
+expression that mentions all the rule's IDs, which in practice is the
+expression that generated the rule. Work on IDs that were never
+registered (such as the variables of lambda arguments) is unattributed. '''
+
+import random
+from collections import Counter, namedtuple
+
+UNATTRIBUTED = '(unattributed)'
+
+class NodeCost(namedtuple('NodeCost', 'expr_id expr_class rules merges walks')):
+    def work(self):
+        return self.merges + self.walks
+
+class CostProfile:
+    def __init__(self, registry):
+        self._registry = registry
+        self._order = None
+        self._merges = Counter()
+        self._walks = Counter()
+
+    @classmethod
+    def sampled(cls, registry, rate, rng=random.random):
+        ''' Returns a profile for a fraction `rate` of calls, and None
+        (which turns profiling off) for the rest. '''
+        if rng() < rate:
+            return cls(registry)
+        return None
+
+    def record_merge(self, t1, t2):
+        self._merges[self._owner(t1, t2)] += 1
+
+    def record_walk(self, instance, general):
+        self._walks[self._owner(instance, general)] += 1
+
+    def costs(self, rules):
+        ''' Returns a NodeCost for each expression that rules or work
+        were charged to, costliest first. '''
+        rule_counts = Counter(
+            self._owner(*self._rule_ids(rule)) for rule in rules.rules()
+        )
+        registered = self._registry.get_registered()
+        owners = set(rule_counts) | set(self._merges) | set(self._walks)
+        costs = [
+            NodeCost(
+                owner,
+                type(registered[owner]).__name__ if owner in registered
+                else UNATTRIBUTED,
+                rule_counts[owner], self._merges[owner], self._walks[owner]
+            )
+            for owner in owners
+        ]
+        costs.sort(key=lambda c: (c.work(), c.rules), reverse=True)
+        return costs
+
+    def costs_by_class(self, rules):
+        totals = {}
+        for cost in self.costs(rules):
+            total = totals.get(
+                cost.expr_class, NodeCost(None, cost.expr_class, 0, 0, 0)
+            )
+            totals[cost.expr_class] = total._replace(
+                rules=total.rules + cost.rules,
+                merges=total.merges + cost.merges,
+                walks=total.walks + cost.walks,
+            )
+        return sorted(totals.values(), key=lambda c: (c.work(), c.rules),
+                      reverse=True)
+
+    def format_report(self, rules, limit=10):
+        lines = ['{:>20} {:<16} {:>8} {:>8} {:>8}'.format(
+            'id', 'class', 'rules', 'merges', 'walks'
+        )]
+        for cost in self.costs(rules)[:limit]:
+            lines.append('{:>20} {:<16} {:>8} {:>8} {:>8}'.format(
+                str(cost.expr_id), cost.expr_class,
+                cost.rules, cost.merges, cost.walks
+            ))
+        return '\n'.join(lines)
+
+    def _rule_ids(self, rule):
+        kind, t1, arg = rule
+        if kind == 'equal' or kind == 'instance_of':
+            return (t1, arg)
+        elif kind == 'specify' and isinstance(arg, tuple):
+            return (t1,) + arg[1:]
+        return (t1,)
+
+    def _owner(self, *ids):
+        if self._order is None:
+            # The registry is complete by the time anything is recorded
+            self._order = {
+                id_: n for (n, id_) in enumerate(self._registry.get_registered())
+            }
+        owner, owner_order = None, None
+        for id_ in ids:
+            order = self._order.get(id_)
+            if order is None:
+                continue
+            if owner_order is None or order < owner_order:
+                owner, owner_order = id_, order
+        return owner
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from cost import CostProfile, UNATTRIBUTED
+from expression import Application
+from expression import If
+from expression import Lambda
+from expression import Let
+from expression import Literal
+from expression import Variable
+from infer import Rules, Registry
+
+class CostProfileTest(unittest.TestCase):
+    def setUp(self):
+        ''' ML code:
+        let id = \\x -> x
+        in if True then id 1 else id 2
+        '''
+        self._rules, self._registry = Rules(), Registry()
+        self._app1 = Application(Variable('id'), [Literal('Int', 1)])
+        self._app2 = Application(Variable('id'), [Literal('Int', 2)])
+        self._if = If(Literal('Bool', True), self._app1, self._app2)
+        self._lambda = Lambda(['x'], Variable('x'))
+        Let([('id', self._lambda)], self._if).add_to_rules(
+            self._rules, self._registry
+        )
+        self._profile = CostProfile(self._registry)
+        self._rules.infer(profile=self._profile)
+
+    def test_every_rule_is_counted_once(self):
+        costs = self._profile.costs(self._rules)
+        self.assertEqual(len(list(self._rules.rules())),
+                         sum(c.rules for c in costs))
+
+    def test_rules_are_charged_to_their_expression(self):
+        costs = {c.expr_id: c for c in self._profile.costs(self._rules)}
+        if_id = self._registry.get_id_for(self._if)
+        app_id = self._registry.get_id_for(self._app1)
+        # The If's two equalities, and the application's function type
+        self.assertEqual(2, costs[if_id].rules)
+        self.assertEqual('If', costs[if_id].expr_class)
+        self.assertEqual(1, costs[app_id].rules)
+
+    def test_solver_work_is_recorded(self):
+        costs = self._profile.costs(self._rules)
+        self.assertGreater(sum(c.merges for c in costs), 0)
+        self.assertGreater(sum(c.walks for c in costs), 0)
+        work = [c.work() for c in costs]
+        self.assertEqual(sorted(work, reverse=True), work)
+
+    def test_costs_by_class(self):
+        by_class = {
+            c.expr_class: c for c in self._profile.costs_by_class(self._rules)
+        }
+        self.assertEqual(2, by_class['Application'].rules)
+        self.assertEqual(
+            sum(c.work() for c in self._profile.costs(self._rules)),
+            sum(c.work() for c in by_class.values())
+        )
+
+    def test_unregistered_ids_are_unattributed(self):
+        rules = Rules().specify('a', 'Int').equal('a', 'b')
+        profile = CostProfile(Registry())
+        rules.infer(profile=profile)
+        self.assertEqual([(None, UNATTRIBUTED, 2, 1, 0)],
+                         profile.costs(rules))
+
+    def test_report(self):
+        report = self._profile.format_report(self._rules, limit=3)
+        self.assertEqual(4, len(report.split('\n')))
+        self.assertIn('merges', report)
+
+    def test_sampling(self):
+        self.assertIsNone(CostProfile.sampled(self._registry, 0.1, lambda: 0.5))
+        self.assertIsNotNone(CostProfile.sampled(self._registry, 0.1, lambda: 0.05))
+
+if __name__ == '__main__':
+    unittest.main()
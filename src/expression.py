@@ -89,6 +89,9 @@ class Let(Expression):
         self._bindings = bindings
         self._body = body_expr
 
+    def get_bindings(self):
+        return list(self._bindings)
+
     def add_to_rules(self, rules, registry):
         id_ = registry.add_to_registry(self)
 
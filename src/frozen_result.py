@@ -0,0 +1,58 @@
+from types import MappingProxyType
+
+from infer import TypeLookup
+
+class FrozenResult(TypeLookup):
+    ''' A read-only copy of a Result for serving queries.
+
+    It is safe for any number of threads to query one FrozenResult at
+    once, including on free-threaded builds of CPython, without locks:
+    `types` and `subs` are private copies behind read-only proxies and
+    are never written after construction. The only shared writes are to
+    the full type cache, and those are single dict operations, which
+    are atomic on every build. Two threads that miss the cache for the
+    same ID compute equal (immutable) tuples, so it doesn't matter
+    which of them is stored. '''
+
+    def __init__(self, result):
+        types, subs = dict(result.types), dict(result.subs)
+        init = super().__setattr__
+        init('types', MappingProxyType(types))
+        init('subs', MappingProxyType(subs))
+        init('_full_types', {})
+        init('_hash', hash((frozenset(types.items()), frozenset(subs.items()))))
+
+    def __repr__(self):
+        return 'FrozenResult(types={}, subs={})'.format(
+            dict(self.types), dict(self.subs)
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, self.__class__):
+            return False
+        return self.types == other.types and self.subs == other.subs
+
+    def __hash__(self):
+        return self._hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError('FrozenResult is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('FrozenResult is read-only')
+
+    def get_full_type_by_id(self, expr_id):
+        try:
+            return self._full_types[expr_id]
+        except KeyError:
+            pass
+        full_type = super().get_full_type_by_id(expr_id)
+        return self._full_types.setdefault(expr_id, full_type)
+
+    def precompute(self, ids=None):
+        ''' Fills the full type cache, so later queries never write. '''
+        if ids is None:
+            ids = list(self.types) + list(self.subs)
+        for expr_id in ids:
+            self.get_full_type_by_id(expr_id)
+        return self
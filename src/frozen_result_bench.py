@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+''' Measures how FrozenResult query throughput scales with the number of
+threads. Throughput only scales on free-threaded builds of CPython; with
+the GIL it stays roughly flat. '''
+
+import argparse
+import sys
+import threading
+import time
+
+from frozen_result import FrozenResult
+from infer import Rules
+
+def chain_result(n):
+    rules = Rules().specify(n, 'Int')
+    for i in range(n):
+        rules.specify(i, ('List', i + 1))
+    return rules.infer()
+
+def run(frozen, ids, num_threads, queries_per_thread):
+    barrier = threading.Barrier(num_threads + 1)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(queries_per_thread):
+            frozen.get_full_type_by_id(ids[(offset + i) % len(ids)])
+            frozen.get_type_by_id(ids[(offset + i * 7) % len(ids)])
+
+    threads = [
+        threading.Thread(target=worker, args=(n * 997,))
+        for n in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return 2 * num_threads * queries_per_thread / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200000,
+                        help='queries per thread')
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), args.size * 4))
+    frozen = FrozenResult(chain_result(args.size)).precompute()
+    ids = list(range(args.size))
+
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('GIL enabled: {}'.format(gil))
+    base = None
+    for num_threads in args.threads:
+        rate = run(frozen, ids, num_threads, args.queries)
+        base = base or rate
+        print('{:3} threads: {:12.0f} queries/s ({:.2f}x)'.format(
+            num_threads, rate, rate / base
+        ))
+
+if __name__ == '__main__':
+    main()
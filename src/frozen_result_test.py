@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import threading
+import unittest
+
+from frozen_result import FrozenResult
+from infer import Rules
+
+def chain_result(n):
+    ''' Each i has the type List (i + 1), ending in an Int. '''
+    rules = Rules().specify(n, 'Int')
+    for i in range(n):
+        rules.specify(i, ('List', i + 1))
+    return rules.infer()
+
+class FrozenResultTest(unittest.TestCase):
+    def setUp(self):
+        self._rules = (
+            Rules().specify(1, ('Pair', 11, 12)).specify(11, 'Int')
+            .equal(1, 2).equal(12, 13)
+        )
+        self._result = self._rules.infer()
+        self._frozen = FrozenResult(self._result)
+
+    def test_queries_match_result(self):
+        for expr_id in [1, 2, 11, 12, 13, 99]:
+            self.assertEqual(self._result.get_type_by_id(expr_id),
+                             self._frozen.get_type_by_id(expr_id))
+            self.assertEqual(self._result.get_full_type_by_id(expr_id),
+                             self._frozen.get_full_type_by_id(expr_id))
+
+    def test_is_read_only(self):
+        with self.assertRaises(TypeError):
+            self._frozen.types[5] = 'Int'
+        with self.assertRaises(TypeError):
+            del self._frozen.subs[2]
+        with self.assertRaises(AttributeError):
+            self._frozen.types = {}
+        with self.assertRaises(AttributeError):
+            self._frozen.extra = {}
+        with self.assertRaises(AttributeError):
+            del self._frozen.subs
+
+    def test_is_a_copy(self):
+        self._result.types[5] = 'Int'
+        self.assertEqual(None, self._frozen.get_type_by_id(5))
+
+    def test_equality(self):
+        self.assertEqual(self._frozen, FrozenResult(self._result))
+        self.assertEqual(hash(self._frozen), hash(FrozenResult(self._result)))
+        self.assertEqual(1, len({self._frozen, FrozenResult(self._result)}))
+        self.assertNotEqual(self._frozen, FrozenResult(chain_result(2)))
+
+    def test_precompute(self):
+        self._frozen.precompute()
+        self.assertEqual(('Pair', 'Int', 'a0'), self._frozen._full_types[2])
+
+    def test_concurrent_readers(self):
+        n = 200
+        expected = chain_result(n)
+        frozen = FrozenResult(expected)
+        errors = []
+
+        def read():
+            for i in range(n, -1, -1):
+                if frozen.get_full_type_by_id(i) != expected.get_full_type_by_id(i):
+                    errors.append(i)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+
+if __name__ == '__main__':
+    unittest.main()
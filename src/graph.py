@@ -2,6 +2,48 @@
 
 import collections
 import itertools
+import mmap
+import os
+import struct
+import sys
+
+# The binary edge list format: each edge is a pair of unsigned 64-bit
+# little-endian ints
+EDGE_FORMAT = struct.Struct('<QQ')
+
+class Condensation:
+    ''' The DAG of a graph's strongly connected components. Components
+    are numbered by their position in `components`, which is in the
+    order Tarjan's algorithm emits them (children first). '''
+
+    def __init__(self, components, component_of, children):
+        self.components = components
+        self.component_of = component_of
+        self.children = children
+
+    def __repr__(self):
+        return 'Condensation(components={}, children={})'.format(
+            self.components, dict(self.children)
+        )
+
+    def __len__(self):
+        return len(self.components)
+
+    def levels(self):
+        ''' Groups the components into levels. Components with no children
+        are on level 0, and every other component is one level above its
+        highest child. No component has a child on its own level, so the
+        components of a level are independent of each other. '''
+        level_of = []
+        for index in range(len(self.components)):
+            # Children come earlier in the order, so their levels are known
+            child_levels = [level_of[c] for c in self.children[index]]
+            level_of.append(max(child_levels) + 1 if child_levels else 0)
+
+        levels = [[] for _ in range(max(level_of) + 1 if level_of else 0)]
+        for (index, level) in enumerate(level_of):
+            levels[level].append(index)
+        return levels
 
 class Graph:
     def __init__(self, vertices, edges):
@@ -23,25 +65,48 @@ class Graph:
 
     @classmethod
     def from_edges(cls, edges):
-        g = Graph.new()
+        g = cls.new()
         g.add_edges(edges)
         return g
 
     @classmethod
     def parse(cls, s):
-        vertices = set()
-        edges = []
+        return cls.read_text(s.split('\n'))
 
-        lines = [l for l in [l.strip() for l in s.split('\n')] if l]
+    @classmethod
+    def read_text(cls, lines):
+        ''' Reads lines of the form `parent: child child ...` from any
+        iterable of lines (such as an open file), one line at a time. '''
+        g = cls.new()
         for line in lines:
+            line = line.strip()
+            if not line:
+                continue
             parent, children = line.split(':')
-            vertices.add(parent)
-            for c in children.split():
-                edges.append((parent, c))
+            parent = parent.strip()
+            g.add_vertex(parent)
+            g.add_edges((parent, c) for c in children.split())
+        return g
 
-        g = cls.from_edges(edges)
-        for v in vertices:
-            g.add_vertex(v)
+    @classmethod
+    def load_text(cls, path):
+        with open(path) as f:
+            return cls.read_text(f)
+
+    @classmethod
+    def load_binary(cls, path):
+        ''' Loads a graph written by dump_binary. The file is mapped
+        rather than read, so only the graph itself has to fit in
+        memory. Vertices are ints. '''
+        g = cls.new()
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size % EDGE_FORMAT.size != 0:
+                raise Exception('{} is not a binary edge list'.format(path))
+            if size == 0:
+                return g
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                g.add_edges(EDGE_FORMAT.iter_unpack(m))
         return g
 
     def __len__(self):
@@ -56,8 +121,38 @@ class Graph:
         return list(self._edges[node])
 
     def add_edges(self, edges):
+        vertices, all_edges = self._vertices, self._edges
         for (start, end) in edges:
-            self.add_edge(start, end)
+            vertices.add(start)
+            vertices.add(end)
+            all_edges[start].add(end)
+
+    def write_text(self, f):
+        ''' Writes the graph in the format read by read_text. '''
+        for v in self._vertices:
+            children = ' '.join(str(c) for c in self._edges.get(v, ()))
+            f.write('{}: {}\n'.format(v, children))
+
+    def dump_text(self, path):
+        with open(path, 'w') as f:
+            self.write_text(f)
+
+    def dump_binary(self, path, chunk_size=65536):
+        ''' Writes the edges in the binary format read by load_binary.
+        Vertices must be non-negative ints, and vertices without any
+        edges are not written. '''
+        pack = EDGE_FORMAT.pack
+        edges = (
+            pack(start, end)
+            for (start, ends) in self._edges.items()
+            for end in ends
+        )
+        with open(path, 'wb') as f:
+            while True:
+                chunk = b''.join(itertools.islice(edges, chunk_size))
+                if not chunk:
+                    break
+                f.write(chunk)
 
     def invert(self):
         inverted = self.with_vertices(self._vertices)
@@ -106,6 +201,25 @@ class Graph:
 
         return components
 
+    def condensation(self):
+        components = self.strongly_connected_components()
+        component_of = {
+            v: index
+            for (index, component) in enumerate(components)
+            for v in component
+        }
+        children = [set() for _ in components]
+        for (index, component) in enumerate(components):
+            for v in component:
+                for child in self._edges.get(v, ()):
+                    child_index = component_of[child]
+                    if child_index != index:
+                        children[index].add(child_index)
+        return Condensation(components, component_of, children)
+
+    def reachability_index(self):
+        return ReachabilityIndex(self)
+
     def _strong_conn(self, root, index, indexes, lowlinks, in_stack, stack, components):
         stack.append(root)
         in_stack.add(root)
@@ -139,3 +253,230 @@ class Graph:
             components.append(component)
 
         return lowlink
+
+class ReachabilityIndex:
+    ''' Answers whether one vertex of a graph can reach another without
+    searching the graph. Each component of the condensation gets a
+    bitset (a Python int) of the components it reaches, including
+    itself. The bitsets are built children first, so each one is the
+    union of its children's.
+
+    Edges added through the index are also added to the graph. An edge
+    that doesn't close a cycle only updates the bitsets of the
+    components that reach its start; one that does rebuilds the index. '''
+
+    def __init__(self, graph):
+        self._graph = graph
+        self.rebuild()
+
+    def rebuild(self):
+        condensation = self._graph.condensation()
+        self._component_of = condensation.component_of
+        self._bits = []
+        for (index, children) in enumerate(condensation.children):
+            bits = 1 << index
+            for child in children:
+                bits |= self._bits[child]
+            self._bits.append(bits)
+
+    def reaches(self, start, end):
+        ''' Returns True if there is a path from `start` to `end`. Every
+        vertex reaches itself. '''
+        if start == end:
+            return True
+        c_start = self._component_of.get(start)
+        c_end = self._component_of.get(end)
+        if c_start is None or c_end is None:
+            return False
+        return (self._bits[c_start] >> c_end) & 1 == 1
+
+    def reachable_from(self, start):
+        ''' Returns the set of vertices that `start` reaches. '''
+        if start not in self._component_of:
+            return {start}
+        bits = self._bits[self._component_of[start]]
+        return {v for (v, c) in self._component_of.items() if (bits >> c) & 1}
+
+    def add_edge(self, start, end):
+        self._graph.add_edge(start, end)
+        if self.reaches(start, end):
+            return
+        if self.reaches(end, start):
+            self.rebuild()
+            return
+
+        c_start = self._add_component(start)
+        c_end = self._add_component(end)
+        end_bits = self._bits[c_end]
+        for (c, bits) in enumerate(self._bits):
+            if (bits >> c_start) & 1:
+                self._bits[c] = bits | end_bits
+
+    def memory_stats(self):
+        bitset_bytes = sum(sys.getsizeof(bits) for bits in self._bits)
+        return {
+            'vertices': len(self._component_of),
+            'components': len(self._bits),
+            'reachable_pairs': sum(bin(bits).count('1') for bits in self._bits),
+            'bitset_bytes': bitset_bytes,
+            'total_bytes': (
+                bitset_bytes + sys.getsizeof(self._bits) +
+                sys.getsizeof(self._component_of)
+            ),
+        }
+
+    def _add_component(self, vertex):
+        if vertex not in self._component_of:
+            index = len(self._bits)
+            self._component_of[vertex] = index
+            self._bits.append(1 << index)
+        return self._component_of[vertex]
+
+class DynamicGraph(Graph):
+    ''' A graph that keeps its strongly connected components up to date
+    as edges are added, instead of running Tarjan's algorithm again.
+
+    Each component is named by one of its vertices. The components are
+    kept in a topological order (parents before children), following
+    Pearce and Kelly: an edge that agrees with the order needs no
+    search, and one that doesn't only searches the components between
+    its ends' positions. If the searches meet, the edge closed a cycle
+    and every component on it is merged into one. '''
+
+    def __init__(self, vertices, edges):
+        super().__init__(set(), collections.defaultdict(set))
+        self._component_of = {}
+        self._members = {}
+        self._component_children = collections.defaultdict(set)
+        self._component_parents = collections.defaultdict(set)
+        self._position = {}
+        self._next_position = 0
+        self._component_order = None
+        # How many components the searches have visited
+        self._searched = 0
+
+        for v in vertices:
+            self.add_vertex(v)
+        for start, ends in list(edges.items()):
+            for end in ends:
+                self.add_edge(start, end)
+
+    def add_vertex(self, name):
+        if name in self._vertices:
+            return
+        super().add_vertex(name)
+        self._component_of[name] = name
+        self._members[name] = {name}
+        self._position[name] = self._next_position
+        self._next_position += 1
+        self._component_order = None
+
+    def add_edge(self, start, end):
+        self.add_vertex(start)
+        self.add_vertex(end)
+        super().add_edge(start, end)
+
+        c_start, c_end = self._component_of[start], self._component_of[end]
+        if c_start == c_end or c_end in self._component_children[c_start]:
+            return
+        self._component_children[c_start].add(c_end)
+        self._component_parents[c_end].add(c_start)
+        self._component_order = None
+
+        if self._position[c_start] > self._position[c_end]:
+            self._reorder(c_start, c_end)
+
+    def add_edges(self, edges):
+        for (start, end) in edges:
+            self.add_edge(start, end)
+
+    def component_of(self, vertex):
+        ''' Returns the name of the component containing `vertex`. '''
+        return self._component_of[vertex]
+
+    def strongly_connected_components(self):
+        ''' Returns the components in the same order Tarjan's algorithm
+        uses: each component comes after every component it reaches. '''
+        if self._component_order is None:
+            self._component_order = sorted(
+                self._members, key=self._position.get, reverse=True
+            )
+        return [set(self._members[c]) for c in self._component_order]
+
+    def condensation(self):
+        ''' Builds the condensation from the components that are kept up
+        to date, rather than from every edge in the graph. '''
+        self.strongly_connected_components()
+        index_of = {c: i for (i, c) in enumerate(self._component_order)}
+        components = [set(self._members[c]) for c in self._component_order]
+        component_of = {
+            v: index_of[c] for (v, c) in self._component_of.items()
+        }
+        children = [
+            {index_of[child] for child in self._component_children.get(c, ())}
+            for c in self._component_order
+        ]
+        return Condensation(components, component_of, children)
+
+    def _reorder(self, c_start, c_end):
+        ''' Restores the order after adding an edge from `c_start` back
+        to the earlier `c_end`. Only components positioned between the
+        two can need to move: those `c_end` reaches move after those
+        that reach `c_start`, reusing the same positions. Components in
+        both sets are on a cycle with the new edge. '''
+        lower, upper = self._position[c_end], self._position[c_start]
+        forward = self._walk_components(
+            c_end, self._component_children,
+            lambda c: self._position[c] <= upper
+        )
+        backward = self._walk_components(
+            c_start, self._component_parents,
+            lambda c: self._position[c] >= lower
+        )
+        self._searched += len(forward) + len(backward)
+
+        positions = sorted(self._position[c] for c in forward | backward)
+        on_cycle = forward & backward
+        by_position = lambda cs: sorted(cs, key=self._position.get)
+        before = by_position(backward - on_cycle)
+        after = by_position(forward - on_cycle)
+        if on_cycle:
+            before.append(self._merge_components(on_cycle))
+
+        for (c, position) in zip(before, positions):
+            self._position[c] = position
+        for (c, position) in zip(after, positions[len(positions) - len(after):]):
+            self._position[c] = position
+
+    def _walk_components(self, start, edges, allowed):
+        seen = {start}
+        to_visit = [start]
+        while to_visit:
+            c = to_visit.pop()
+            for next_c in edges.get(c, ()):
+                if next_c not in seen and allowed(next_c):
+                    seen.add(next_c)
+                    to_visit.append(next_c)
+        return seen
+
+    def _merge_components(self, components):
+        merged = max(components, key=lambda c: len(self._members[c]))
+        for c in components:
+            if c == merged:
+                continue
+            del self._position[c]
+            for v in self._members.pop(c):
+                self._component_of[v] = merged
+                self._members[merged].add(v)
+            for child in self._component_children.pop(c, ()):
+                self._component_parents[child].discard(c)
+                self._component_parents[child].add(merged)
+                self._component_children[merged].add(child)
+            for parent in self._component_parents.pop(c, ()):
+                self._component_children[parent].discard(c)
+                self._component_children[parent].add(merged)
+                self._component_parents[merged].add(parent)
+
+        self._component_children[merged] -= components
+        self._component_parents[merged] -= components
+        return merged
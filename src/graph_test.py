@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 
+import os
+import random
+import tempfile
 import unittest
 
-from graph import Graph
+from graph import DynamicGraph, Graph, ReachabilityIndex
 
 test_graph = Graph.parse('''
 a: b
@@ -20,10 +23,190 @@ class GraphTest(unittest.TestCase):
         self.assertSetEqual(set('a b c d e f g h'.split()),
                             set(test_graph.get_vertices()))
 
+    def test_parsing_keeps_vertices_without_children(self):
+        g = Graph.parse('a: b\nc:\n')
+        self.assertEqual({'a', 'b', 'c'}, set(g.get_vertices()))
+        self.assertEqual([], g.get_children('c'))
+
+    def test_text_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'graph.txt')
+            test_graph.dump_text(path)
+            self.assertEqual(test_graph, Graph.load_text(path))
+            loaded = DynamicGraph.load_text(path)
+        self.assertEqual(loaded.component_of('a'), loaded.component_of('e'))
+
+    def test_binary_round_trip(self):
+        rng = random.Random(2)
+        edges = [(rng.randrange(2 ** 40), rng.randrange(100)) for _ in range(500)]
+        g = Graph.from_edges(edges)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'graph.bin')
+            g.dump_binary(path, chunk_size=64)
+            self.assertEqual(g, Graph.load_binary(path))
+
+            empty_path = os.path.join(tmp_dir, 'empty.bin')
+            Graph.new().dump_binary(empty_path)
+            self.assertEqual(Graph.new(), Graph.load_binary(empty_path))
+
+            with open(path, 'ab') as f:
+                f.write(b'\0')
+            with self.assertRaises(Exception):
+                Graph.load_binary(path)
+
     def test_strongly_connected_components(self):
         scc = test_graph.strongly_connected_components()
         expected = [{'g', 'f'}, {'d', 'c', 'h'}, {'e', 'b', 'a'}]
         self.assertEqual(expected, scc)
 
+    def test_condensation(self):
+        condensation = test_graph.condensation()
+        self.assertEqual(3, len(condensation))
+        fg = condensation.component_of['f']
+        cdh = condensation.component_of['c']
+        abe = condensation.component_of['a']
+        self.assertEqual(set(), condensation.children[fg])
+        self.assertEqual({fg}, condensation.children[cdh])
+        self.assertEqual({fg, cdh}, condensation.children[abe])
+
+    def test_condensation_levels(self):
+        g = Graph.from_edges([(1, 2), (2, 3), (3, 2), (4, 3), (5, 1), (6, 6)])
+        condensation = g.condensation()
+        levels = [
+            sorted(v for c in level for v in condensation.components[c])
+            for level in condensation.levels()
+        ]
+        self.assertEqual([[2, 3, 6], [1, 4], [5]], levels)
+
+    def test_empty_condensation(self):
+        self.assertEqual([], Graph.new().condensation().levels())
+
+    def test_dynamic_graph_components(self):
+        g = DynamicGraph.parse('''
+        a: b
+        b: e f c
+        c: g d
+        d: c h
+        e: a f
+        f: g
+        g: f
+        h: g d
+        ''')
+        scc = g.strongly_connected_components()
+        self.assertCountEqual(
+            [{'g', 'f'}, {'d', 'c', 'h'}, {'e', 'b', 'a'}], scc
+        )
+        self.assertIsComponentOrder(g, scc)
+
+    def test_dynamic_graph_merges_when_cycle_is_closed(self):
+        g = DynamicGraph.from_edges([(1, 2), (2, 3), (3, 4), (5, 4)])
+        self.assertEqual(5, len(g.strongly_connected_components()))
+        g.add_edge(4, 2)
+        self.assertEqual(g.component_of(2), g.component_of(4))
+        self.assertEqual(g.component_of(3), g.component_of(4))
+        self.assertNotEqual(g.component_of(1), g.component_of(2))
+        self.assertCountEqual(
+            [{1}, {2, 3, 4}, {5}], g.strongly_connected_components()
+        )
+
+    def test_dynamic_graph_searches_only_between_positions(self):
+        g = DynamicGraph.new()
+        for i in range(1000):
+            g.add_edge(i, i + 1)
+        self.assertEqual(0, g._searched)
+
+        g.add_edge(501, 500)
+        self.assertEqual(4, g._searched)
+        self.assertEqual(g.component_of(500), g.component_of(501))
+
+        # Only the components from 995 onwards are searched
+        g.add_edge(1000, 2000)
+        g.add_edge(2001, 995)
+        self.assertEqual(4 + 8, g._searched)
+        g.add_edge(10, 0)
+        self.assertEqual(4 + 8 + 22, g._searched)
+        self.assertIsComponentOrder(g, g.strongly_connected_components())
+
+    def test_dynamic_graph_matches_tarjan(self):
+        rng = random.Random(4)
+        for _ in range(100):
+            edges = [(rng.randrange(30), rng.randrange(30)) for _ in range(45)]
+            g = DynamicGraph.new()
+            for (i, edge) in enumerate(edges):
+                g.add_edge(*edge)
+                if i % 9 == 0:
+                    expected = Graph.from_edges(edges[:i + 1])
+                    self.assertComponentsMatch(expected, g)
+            self.assertComponentsMatch(Graph.from_edges(edges), g)
+
+    def test_reachability_index(self):
+        index = test_graph.reachability_index()
+        self.assertTrue(index.reaches('a', 'h'))
+        self.assertTrue(index.reaches('h', 'c'))
+        self.assertFalse(index.reaches('c', 'a'))
+        self.assertFalse(index.reaches('f', 'd'))
+        self.assertTrue(index.reaches('z', 'z'))
+        self.assertFalse(index.reaches('a', 'z'))
+        self.assertEqual({'c', 'd', 'f', 'g', 'h'}, index.reachable_from('d'))
+
+        stats = index.memory_stats()
+        self.assertEqual(8, stats['vertices'])
+        self.assertEqual(3, stats['components'])
+        self.assertEqual(6, stats['reachable_pairs'])
+
+    def test_reachability_index_matches_dfs(self):
+        rng = random.Random(7)
+        for _ in range(10):
+            edges = [(rng.randrange(25), rng.randrange(25)) for _ in range(35)]
+            g = Graph.from_edges(edges[:10])
+            index = ReachabilityIndex(g)
+            for edge in edges[10:]:
+                index.add_edge(*edge)
+            for v in range(25):
+                reached = set()
+                g._walk_dfs(v, set(), reached.add)
+                for w in range(25):
+                    self.assertEqual(w in reached, index.reaches(v, w))
+
+    def test_dynamic_graph_condensation(self):
+        rng = random.Random(5)
+        edges = [(rng.randrange(30), rng.randrange(30)) for _ in range(45)]
+        g = DynamicGraph.new()
+        g.add_edges(edges)
+        static = Graph.from_edges(edges)
+        # The condensation shouldn't need the graph's edges at all
+        g._edges = None
+        condensation = g.condensation()
+        index = g.reachability_index()
+
+        expected = static.condensation()
+        self.assertEqual(len(expected), len(condensation))
+        level_sets = lambda c: [
+            sorted(v for i in level for v in c.components[i])
+            for level in c.levels()
+        ]
+        self.assertEqual(level_sets(expected), level_sets(condensation))
+        static_index = static.reachability_index()
+        for v in range(30):
+            for w in range(30):
+                self.assertEqual(static_index.reaches(v, w), index.reaches(v, w))
+
+    def assertComponentsMatch(self, expected, dynamic):
+        scc = dynamic.strongly_connected_components()
+        self.assertCountEqual(
+            [frozenset(c) for c in expected.strongly_connected_components()],
+            [frozenset(c) for c in scc]
+        )
+        self.assertIsComponentOrder(dynamic, scc)
+
+    def assertIsComponentOrder(self, graph, components):
+        position = {}
+        for (i, component) in enumerate(components):
+            for v in component:
+                position[v] = i
+        for v in graph.get_vertices():
+            for child in graph.get_children(v):
+                self.assertLessEqual(position[child], position[v])
+
 if __name__ == '__main__':
     unittest.main()
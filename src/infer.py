@@ -1,14 +1,224 @@
-from collections import defaultdict, namedtuple
+import os
+import pickle
+import sys
+import time
+from collections import ChainMap, Counter, defaultdict, namedtuple
+from collections.abc import MutableMapping
 
 from graph import Graph
+from type_index import TypeIndex
 
 class InferenceError(Exception):
     pass
 
-def dict_map(fn, d):
-    return {k: fn(v) for k, v in d.items()}
+class BudgetExceededError(Exception):
+    ''' Raised when inference is stopped before it finished. This is not
+    an InferenceError, since it says nothing about whether the rules
+    are consistent. `stats` has the work done before stopping. '''
+
+    def __init__(self, reason, stats):
+        super().__init__(
+            '{} (after {} steps)'.format(reason, stats['steps'])
+        )
+        self.reason = reason
+        self.stats = stats
+
+class CancellationToken:
+    def __init__(self):
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+class Budget:
+    ''' Limits the work one call to infer can do. The solver calls step
+    once per item it takes off a work list. '''
+
+    # Reading the clock is slower than a step, so only check it on the
+    # first step and then this often
+    CLOCK_INTERVAL = 64
+
+    def __init__(self, max_steps=None, timeout=None, cancel=None):
+        self._max_steps = max_steps
+        self._cancel = cancel
+        self._start = time.monotonic()
+        self._deadline = None if timeout is None else self._start + timeout
+        self._steps = 0
+        self._phase_steps = Counter()
+
+    def step(self, phase):
+        self._steps += 1
+        self._phase_steps[phase] += 1
+        if self._max_steps is not None and self._steps > self._max_steps:
+            self._exceeded('step limit of {} reached'.format(self._max_steps))
+        if self._cancel is not None and self._cancel.is_cancelled():
+            self._exceeded('cancelled')
+        if (self._deadline is not None and
+                self._steps % self.CLOCK_INTERVAL == 1 and
+                time.monotonic() > self._deadline):
+            self._exceeded('deadline passed')
+
+    def stats(self):
+        return {
+            'steps': self._steps,
+            'phase_steps': dict(self._phase_steps),
+            'elapsed': time.monotonic() - self._start,
+        }
+
+    def _exceeded(self, reason):
+        raise BudgetExceededError(reason, self.stats())
+
+def _stable_key(var):
+    return (type(var).__name__, var)
+
+def fork_mapping(mapping):
+    ''' Returns (parent, child) layered views of `mapping` that share
+    everything written so far and each write to their own top layer. '''
+    if isinstance(mapping, ChainMap):
+        shared = mapping.maps[1:] if not mapping.maps[0] else mapping.maps
+    else:
+        shared = [mapping]
+    return ChainMap({}, *shared), ChainMap({}, *shared)
+
+class SharedList:
+    ''' An append-only list whose contents can be shared with forks.
+
+    Forking freezes the items appended so far into a segment that both
+    sides keep a reference to; later appends go to each side's own
+    tail, so neither can see the other's additions. '''
+
+    def __init__(self, segments=()):
+        self._segments = segments
+        self._tail = []
+
+    def __repr__(self):
+        return 'SharedList({})'.format(list(self))
+
+    def __iter__(self):
+        for segment in self._segments:
+            yield from segment
+        yield from self._tail
+
+    def __len__(self):
+        return sum(map(len, self._segments)) + len(self._tail)
+
+    def append(self, item):
+        self._tail.append(item)
+
+    def __reversed__(self):
+        yield from reversed(self._tail)
+        for segment in self._segments[::-1]:
+            yield from reversed(segment)
+
+    def fork(self):
+        if self._tail:
+            self._segments = self._segments + (self._tail,)
+            self._tail = []
+        return SharedList(self._segments)
+
+def _type_args(t):
+    if isinstance(t, tuple):
+        return t[1:]
+    return ()
+
+def _replacement_of(var):
+    return (var,)
+
+class IndexedMapping(MutableMapping):
+    ''' A mapping that also indexes its keys by the variables that their
+    values mention (as listed by `mentioned`), so that replacing a
+    variable only visits the values that mention it. The items and the
+    index are kept in the mappings given, which may be spilled. '''
+
+    def __init__(self, mapping, index, mentioned, items=()):
+        self.mapping = mapping
+        self._index = index
+        self._mentioned = mentioned
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def __repr__(self):
+        return 'IndexedMapping({!r})'.format(self.mapping)
+
+    def __getitem__(self, key):
+        return self.mapping[key]
+
+    def get(self, key, default=None):
+        return self.mapping.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.mapping
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def items(self):
+        return self.mapping.items()
+
+    def __setitem__(self, key, value):
+        if key in self.mapping:
+            self._unindex(key, self.mapping[key])
+        self.mapping[key] = value
+        for var in self._mentioned(value):
+            keys = self._index.get(var)
+            if keys is None:
+                keys = set()
+            keys.add(key)
+            # Written back so a spilled index sees the change
+            self._index[var] = keys
+
+    def __delitem__(self, key):
+        value = self.mapping[key]
+        del self.mapping[key]
+        self._unindex(key, value)
+
+    def keys_mentioning(self, var):
+        return list(self._index.get(var, ()))
+
+    def count_mentioning(self, var):
+        return len(self._index.get(var, ()))
+
+    def _unindex(self, key, value):
+        for var in set(self._mentioned(value)):
+            keys = self._index.get(var)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if keys:
+                self._index[var] = keys
+            else:
+                del self._index[var]
+
+class DisjointSets:
+    def __init__(self):
+        self._parents = {}
+
+    def find(self, item):
+        root = item
+        while self._parents.get(root, root) != root:
+            root = self._parents[root]
+        # Compress the path so later finds are quick
+        while item != root:
+            item, self._parents[item] = self._parents[item], root
+        return root
+
+    def union(self, item1, item2):
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 != root2:
+            self._parents[root2] = root1
+
+def infer_all(rules_list):
+    return [rules.infer() for rules in rules_list]
+
+class TypeLookup:
+    ''' Type queries for classes with `types` and `subs` mappings. '''
 
-class Result(namedtuple('Result', 'types subs')):
     def get_type_by_id(self, expr_id):
         subbed_id = self.subs.get(expr_id, expr_id)
         return self.types.get(subbed_id, None)
@@ -39,8 +249,54 @@ class Result(namedtuple('Result', 'types subs')):
             result.append(replacement)
         return result
 
+class Result(TypeLookup, namedtuple('Result', 'types subs')):
+    def build_index(self, ids=None):
+        ''' Builds a TypeIndex over `ids` (by default every ID in the
+        result), such as the IDs in a Registry. '''
+        return TypeIndex(self, ids)
+
+    def prune(self, roots):
+        ''' Returns a copy with only the IDs needed to give the types of
+        `roots` (e.g. the IDs in a Registry), with type arguments
+        rewritten to the IDs that replaced them, and an estimate of the
+        number of bytes this saves. '''
+        types, subs = {}, {}
+        seen = set()
+        to_visit = list(roots)
+        while to_visit:
+            expr_id = to_visit.pop()
+            if expr_id in seen:
+                continue
+            seen.add(expr_id)
+
+            type_id = self.subs.get(expr_id, expr_id)
+            if type_id != expr_id:
+                subs[expr_id] = type_id
+            t = self.types.get(type_id)
+            if t is None:
+                continue
+            if isinstance(t, tuple):
+                arg_ids = [self.subs.get(arg, arg) for arg in t[1:]]
+                t = tuple([t[0]] + arg_ids)
+                to_visit.extend(arg_ids)
+            types[type_id] = t
+
+        pruned = Result(types, subs)
+        return pruned, self._size_in_bytes() - pruned._size_in_bytes()
+
+    def _size_in_bytes(self):
+        size = 0
+        for mapping in self:
+            size += sys.getsizeof(mapping)
+            for k, v in mapping.items():
+                size += sys.getsizeof(k) + sys.getsizeof(v)
+                if isinstance(v, tuple):
+                    size += sum(map(sys.getsizeof, v))
+        return size
+
 class Registry:
-    def __init__(self):
+    def __init__(self, prelude=None):
+        self._prelude = prelude
         self._next_id = 1
         self._id_to_expression = {}
         self._expression_to_id = {}
@@ -52,11 +308,28 @@ class Registry:
             .format(self._next_id, self._id_to_expression, self._scope_stack)
         )
 
+    def fork(self):
+        ''' Returns a copy that can register expressions and generate IDs
+        without affecting this registry. The copy is cheap because it
+        shares everything registered so far. '''
+        forked = Registry(prelude=self._prelude)
+        forked._next_id = self._next_id
+        self._id_to_expression, forked._id_to_expression = \
+            fork_mapping(self._id_to_expression)
+        self._expression_to_id, forked._expression_to_id = \
+            fork_mapping(self._expression_to_id)
+        # Scopes are never changed after they are pushed
+        forked._scope_stack = list(self._scope_stack)
+        return forked
+
     def lookup_var_in_scope(self, real_name):
         for scope in self._scope_stack[::-1]:
             if real_name in scope:
                 return scope[real_name]
-        # TODO: support globals (like `+`)
+        if self._prelude is not None:
+            global_id = self._prelude.lookup(real_name)
+            if global_id is not None:
+                return (global_id, True)
         return None # Var is not bound
 
     def push_new_scope(self, scope):
@@ -100,10 +373,29 @@ class Registry:
         return id_
 
 class Rules:
-    def __init__(self):
-        self._equal_rules = []
-        self._specified_types = []
-        self._generic_relations = []
+    def __init__(self, prelude=None, store=None):
+        ''' If `store` (a spill.SqliteStore) is given, the rules and the
+        solver's types, substitutions and equality work list are kept
+        in it rather than in memory. '''
+        self._prelude = prelude
+        self._store = store
+        self._equal_rules = self._new_list()
+        self._specified_types = self._new_list()
+        self._generic_relations = self._new_list()
+        self._class_constraints = self._new_list()
+        # Maps (type constructor, class name) to the instance's context
+        self._instances = {}
+
+    def fork(self):
+        ''' Returns a copy that further rules can be added to without
+        affecting these rules. The copy shares the existing rules. '''
+        forked = Rules(prelude=self._prelude, store=self._store)
+        forked._equal_rules = self._equal_rules.fork()
+        forked._specified_types = self._specified_types.fork()
+        forked._generic_relations = self._generic_relations.fork()
+        forked._class_constraints = self._class_constraints.fork()
+        self._instances, forked._instances = fork_mapping(self._instances)
+        return forked
 
     def equal(self, t1, t2):
         self._equal_rules.append( (t1, t2) )
@@ -117,66 +409,291 @@ class Rules:
         self._generic_relations.append( (instance, general) )
         return self
 
-    def infer(self):
-        types, subs = self._collapse_equal()
-        types1, subs1 = self._apply_generics(types, subs)
-        return Result(types1, subs1)
+    def has_class(self, t1, class_name):
+        self._class_constraints.append( (t1, class_name) )
+        return self
+
+    def class_instance(self, class_name, type_con, context=()):
+        ''' Declares that types built with `type_con` are in the class.
+        `context` lists (argument index, class name) pairs that the
+        type's arguments must satisfy, so `instance Show a => Show
+        (List a)` is class_instance('Show', 'List', [(0, 'Show')]). '''
+        key = (type_con, class_name)
+        if key in self._instances:
+            raise Exception(
+                '{} already has an instance for {}'.format(class_name, type_con)
+            )
+        self._instances[key] = tuple(context)
+        return self
+
+    def infer(self, max_steps=None, timeout=None, cancel=None, profile=None,
+              targets=None):
+        ''' Solves the rules. Raises BudgetExceededError if this takes
+        more than `max_steps` steps or `timeout` seconds, or if the
+        CancellationToken `cancel` is cancelled. The solver's work is
+        recorded in `profile` (a cost.CostProfile) if one is given.
+
+        If `targets` is given, only the rules that the types of those
+        IDs depend on are solved (see dependency_cone), so the result
+        may not have types for the other IDs. '''
+        rules = self if targets is None else self.dependency_cone(targets)
+        budget = Budget(max_steps, timeout, cancel)
+        return rules.solver(budget, profile).run()
+
+    def solver(self, budget=None, profile=None):
+        ''' Returns a Solver that can solve these rules a few steps at a
+        time. Rules added after this aren't seen by the solver. '''
+        return Solver(self, budget, profile)
+
+    def rules(self):
+        ''' Yields each rule as a tuple of its kind and arguments, like
+        ('equal', t1, t2) or ('specify', t1, given). '''
+        for t1, t2 in self._equal_rules:
+            yield ('equal', t1, t2)
+        for t1, given in self._specified_types:
+            yield ('specify', t1, given)
+        for instance, general in self._generic_relations:
+            yield ('instance_of', instance, general)
+        for t1, class_name in self._class_constraints:
+            yield ('has_class', t1, class_name)
+
+    def simplify(self):
+        ''' Removes redundant rules before solving: duplicate rules,
+        variables equal to or instances of themselves, and equalities
+        implied by other equalities (each set of equal variables ends up
+        with one equality per variable). Specified types are grouped by
+        variable. Returns how many rules were eliminated. '''
+        before = self._rule_count()
+
+        sets = DisjointSets()
+        members = {}
+        for t1, t2 in self._equal_rules:
+            if t1 == t2:
+                continue
+            members.setdefault(t1, None)
+            members.setdefault(t2, None)
+            sets.union(t1, t2)
+        equal_rules = self._new_list()
+        for var in members:
+            root = sets.find(var)
+            if root != var:
+                equal_rules.append( (root, var) )
+
+        specified = defaultdict(dict)
+        for var, given in self._specified_types:
+            specified[var].setdefault(given, None)
+        specified_types = self._new_list()
+        for var, givens in specified.items():
+            for given in givens:
+                specified_types.append( (var, given) )
+
+        self._equal_rules = equal_rules
+        self._specified_types = specified_types
+        self._generic_relations = self._unique(
+            (i, g) for (i, g) in self._generic_relations if i != g
+        )
+        self._class_constraints = self._unique(self._class_constraints)
+        return before - self._rule_count()
+
+    def _new_list(self):
+        if self._store is None:
+            return SharedList()
+        return self._store.sequence()
+
+    def _new_mapping(self, items):
+        if self._store is None:
+            return dict(items)
+        return self._store.mapping(items)
+
+    def _new_indexed_mapping(self, mentioned, items=()):
+        return IndexedMapping(
+            self._new_mapping({}), self._new_mapping({}), mentioned, items
+        )
+
+    def _new_stack(self, items=()):
+        if self._store is None:
+            return list(items)
+        return self._store.stack(items)
+
+    def _rule_count(self):
+        return (
+            len(self._equal_rules) + len(self._specified_types) +
+            len(self._generic_relations) + len(self._class_constraints)
+        )
+
+    def _unique(self, items):
+        unique = self._new_list()
+        for item in dict.fromkeys(items):
+            unique.append(item)
+        return unique
+
+    def generic_index(self, result=None):
+        ''' Returns a ReachabilityIndex over the instance_of relations,
+        with edges from instances to their generals. If a `result` is
+        given, the relations are between the IDs it substituted. '''
+        subs = {} if result is None else result.subs
+        return self._generic_graph(subs).reachability_index()
+
+    def dependency_cone(self, targets):
+        ''' Returns Rules with only the rules that the types of `targets`
+        depend on. Equal and specified types depend on each other both
+        ways, but an instance depends on its general and not the other
+        way around, so the other instances of a general are left out. '''
+        depends_on = defaultdict(list)
+        for t1, t2 in self._equal_rules:
+            depends_on[t1].append(t2)
+            depends_on[t2].append(t1)
+        for var, given in self._specified_types:
+            for type_var in self._type_vars(given):
+                depends_on[var].append(type_var)
+                depends_on[type_var].append(var)
+        for instance, general in self._generic_relations:
+            depends_on[instance].append(general)
+
+        needed = set()
+        to_visit = list(targets)
+        while to_visit:
+            var = to_visit.pop()
+            if var in needed:
+                continue
+            needed.add(var)
+            to_visit.extend(depends_on.get(var, ()))
+
+        cone = Rules(prelude=self._prelude)
+        for t1, t2 in self._equal_rules:
+            if t1 in needed:
+                cone.equal(t1, t2)
+        for var, given in self._specified_types:
+            if var in needed:
+                cone.specify(var, given)
+        for instance, general in self._generic_relations:
+            if instance in needed:
+                cone.instance_of(instance, general)
+        for var, class_name in self._class_constraints:
+            if var in needed:
+                cone.has_class(var, class_name)
+        cone._instances = self._instances
+        return cone
+
+    def partitions(self):
+        ''' Splits these rules into Rules that don't share any variables,
+        and so can be solved separately. '''
+        sets = DisjointSets()
+        for t1, t2 in self._equal_rules:
+            sets.union(t1, t2)
+        for var, given in self._specified_types:
+            for type_var in self._type_vars(given):
+                sets.union(var, type_var)
+        for instance, general in self._generic_relations:
+            # Each partition gets its own copy of the prelude's types
+            if not self._is_global(general):
+                sets.union(instance, general)
+
+        partitions = defaultdict(lambda: Rules(prelude=self._prelude))
+        for t1, t2 in self._equal_rules:
+            partitions[sets.find(t1)].equal(t1, t2)
+        for var, given in self._specified_types:
+            partitions[sets.find(var)].specify(var, given)
+        for instance, general in self._generic_relations:
+            partitions[sets.find(instance)].instance_of(instance, general)
+        for var, class_name in self._class_constraints:
+            partitions[sets.find(var)].has_class(var, class_name)
+        for partition in partitions.values():
+            partition._instances = self._instances
+        return list(partitions.values())
+
+    def infer_partitioned(self, executor=None, chunksize=1):
+        ''' Like infer, but solves each of the partitions separately,
+        using `executor` (e.g. a ProcessPoolExecutor) if it is given. '''
+        partitions = self.partitions()
+        chunks = [
+            partitions[i:i + chunksize]
+            for i in range(0, len(partitions), chunksize)
+        ]
+        if executor is None:
+            chunk_results = map(infer_all, chunks)
+        else:
+            chunk_results = executor.map(infer_all, chunks)
+
+        types, subs = {}, {}
+        for results in chunk_results:
+            for result in results:
+                types.update(result.types)
+                subs.update(result.subs)
+        return Result(types, subs)
+
+    def _is_global(self, var):
+        return self._prelude is not None and self._prelude.is_global(var)
 
     def _equality_pairs_from_set(self, items):
         if len(items) < 2:
             return []
-        ii = iter(items)
+        # Sorted so the pairs don't depend on the set's iteration order
+        ii = iter(sorted(items, key=_stable_key))
         primary = next(ii)
         return [(primary, item) for item in ii]
 
-    def _apply_generics(self, types, subs):
-        subbed_generic_relations = [
-            (subs.get(i, i), subs.get(g, g))
-            for (i, g) in self._generic_relations
+    def _generic_levels(self, subs):
+        ''' Returns the equalities between generics that are instances of
+        each other, and the generic relations grouped into levels so that
+        generals are resolved before their instances. The relations on
+        one level don't depend on each other. '''
+        generic_relations = self._generic_graph(subs)
+        condensation = generic_relations.condensation()
+        equality_pairs = []
+        for subcomponent in condensation.components:
+            equality_pairs.extend(self._equality_pairs_from_set(subcomponent))
+
+        levels = [
+            self._pick_generic_pairs(generic_relations, condensation, level)
+            for level in condensation.levels()
         ]
-        generic_relations = Graph.from_edges(subbed_generic_relations)
-        subcomps = generic_relations.strongly_connected_components()
-        for subcomponent in subcomps:
-            equality_pairs = self._equality_pairs_from_set(subcomponent)
-            if equality_pairs:
-                types, subs = self._apply_equal_rules(equality_pairs, types, subs)
+        return equality_pairs, levels
 
-        generic_pairs = self._pick_generic_pairs(generic_relations, subcomps)
-        return self._apply_generic_rules(generic_pairs[::-1], types, subs)
+    def _generic_graph(self, subs):
+        return Graph.from_edges(
+            (subs.get(i, i), subs.get(g, g))
+            for (i, g) in self._generic_relations
+        )
 
-    def _pick_generic_pairs(self, graph, subcomponents):
+    def _pick_generic_pairs(self, graph, condensation, level):
         pairs = []
-        for subcomponent in subcomponents:
-            for var in subcomponent:
+        for index in level:
+            for var in condensation.components[index]:
                 for child_var in graph.get_children(var):
                     pairs.append( (var, child_var) )
         return pairs
 
-    def _apply_generic_rules(self, generic_pairs, types, subs):
-        equality_pairs = []
-
-        while generic_pairs:
-            instance, general = generic_pairs.pop()
-            equality_pairs.extend(
-                self._walk_for_equality_pairs(types, instance, general)
-            )
-            # Substitutions should have already been applied
-            itype, gtype = types.get(instance), types.get(general)
-
-            result, new_pairs = self._merge_generic(itype, gtype)
-            if new_pairs:
-                generic_pairs.extend(list(new_pairs))
-            if result is not None:
-                types[instance] = result
+    def _apply_generic_rule(self, instance, general, generic_pairs,
+                            equality_pairs, types, instances, budget):
+        instances[general].add(instance)
+        equality_pairs.extend(
+            self._walk_for_equality_pairs(types, instance, general, budget)
+        )
+        # Substitutions should have already been applied
+        itype, gtype = types.get(instance), types.get(general)
 
-        return self._apply_equal_rules(equality_pairs, types, subs)
+        result, new_pairs = self._merge_generic(itype, gtype)
+        if new_pairs:
+            generic_pairs.extend(list(new_pairs))
+        if result is not None:
+            types[instance] = result
 
-    def _walk_for_equality_pairs(self, types, instance, general):
+    def _walk_for_equality_pairs(self, types, instance, general, budget):
         # TODO: use a structure more like this for applying generic rules
         generic_mappings = defaultdict(set)
         pairs = [(instance, general)]
+        # Shared type variables would otherwise be walked once per path
+        # to them
+        seen = set()
         while pairs:
-            instance, general = pairs.pop()
+            if budget is not None:
+                budget.step('generic_walk')
+            pair = pairs.pop()
+            if pair in seen:
+                continue
+            seen.add(pair)
+            instance, general = pair
             generic_mappings[general].add(instance)
             itype, gtype = types.get(instance), types.get(general)
 
@@ -202,59 +719,91 @@ class Rules:
             new_rules = zip(self._type_vars(itype), self._type_vars(gtype))
             return itype, new_rules
 
-    def _collapse_equal(self):
-        types, adtnl_equal_rules = self._collapse_specified_types()
-        equal_rules = self._equal_rules + adtnl_equal_rules
-        return self._apply_equal_rules(equal_rules, types, subs={})
+    def _resolve_class(self, to_resolve, resolved, types, subs, instances):
+        ''' Checks that one class constraint has an instance. Each
+        (class, variable) pair is only resolved once, and finding an
+        instance is a single lookup by the type's constructor. '''
+        class_name, var = to_resolve.pop()
+        var = subs.get(var, var)
+        if (class_name, var) in resolved:
+            return
+        resolved.add( (class_name, var) )
+
+        # Generic variables constrain each of their instances
+        for instance in instances.get(var, ()):
+            to_resolve.append( (class_name, instance) )
 
-    def _collapse_specified_types(self):
-        ''' This handles any case where twoo types have
+        var_type = types.get(var)
+        if var_type is None:
+            return
+        context = self._instances.get(
+            (self._type_con(var_type), class_name)
+        )
+        if context is None:
+            raise InferenceError(
+                '{} is not an instance of {}'.format(var_type, class_name)
+            )
+        type_vars = self._type_vars(var_type)
+        for (index, required_class) in context:
+            to_resolve.append( (required_class, type_vars[index]) )
+
+    def _collapse_specified_type(self, var, given, types, equal_rules):
+        ''' This handles any case where two types have
         been given for the same variable. '''
-        types = {}
-        equal_rules = []
+        result, new_rules = self._merge_types(types.get(var), given)
+        if new_rules:
+            equal_rules.extend(list(new_rules))
+        types[var] = result
 
-        for var, given in self._specified_types:
-            result, new_rules = self._merge_types(types.get(var), given)
-            if new_rules:
-                equal_rules.extend(list(new_rules))
-            types[var] = result
-
-        return types, equal_rules
-
-    def _apply_equal_rules(self, equal_rules, types, subs):
-        while equal_rules:
-            t1, t2 = equal_rules.pop()
-            t1, t2 = subs.get(t1, t1), subs.get(t2, t2)
-            type1, type2 = types.get(t1), types.get(t2)
-
-            # Default to the type that is set to make the output
-            # more predictable. This doesn't actually do anything
-            # for the algorithm.
-            if type1 is None and type2 is not None:
-                replacement, replaced = t2, t1
-            else:
-                replacement, replaced = t1, t2
+    def _prelude_types(self):
+        ''' Globals are only ever used generically, so only the globals
+        that are the general side of a relation need their types. '''
+        if self._prelude is None:
+            return {}
+        return self._prelude.types_for(g for (_, g) in self._generic_relations)
 
-            result, new_rules = self._merge_types(type1, type2)
-            if new_rules:
-                equal_rules.extend(list(new_rules))
-            subs = self._add_replacement(subs, replaced, replacement)
-            if replaced in types:
-                del types[replaced]
+    def _apply_equal_rule(self, t1, t2, equal_rules, types, subs):
+        t1, t2 = subs.get(t1, t1), subs.get(t2, t2)
+        if t1 == t2:
+            # Already equal. Merging a type with itself would only add
+            # rules to merge its arguments with themselves, which never
+            # ends if the type is infinite.
+            return types, subs
+        type1, type2 = types.get(t1), types.get(t2)
 
-            if result is not None:
-                types[replacement] = result
-            elif replacement in types:
-                del types[replacement]
+        # Default to the type that is set to make the output more
+        # predictable. When that doesn't decide it, replace the variable
+        # that fewer others have been replaced with, so that each merge
+        # rewrites the smaller set of substitutions.
+        if (type1 is None) != (type2 is None):
+            swap = type1 is None
+        else:
+            swap = subs.count_mentioning(t1) < subs.count_mentioning(t2)
+        if swap:
+            replacement, replaced = t2, t1
+        else:
+            replacement, replaced = t1, t2
 
-            types = self._apply_sub_to_types(types, replaced, replacement)
+        result, new_rules = self._merge_types(type1, type2)
+        if new_rules:
+            equal_rules.extend(list(new_rules))
+        subs = self._add_replacement(subs, replaced, replacement)
+        if replaced in types:
+            del types[replaced]
 
+        if result is not None:
+            types[replacement] = result
+        elif replacement in types:
+            del types[replacement]
+
+        types = self._apply_sub_to_types(types, replaced, replacement)
         return types, subs
 
-    def _add_replacement(self, old_subs, replaced, replacement):
+    def _add_replacement(self, subs, replaced, replacement):
         if replaced == replacement:
-            return old_subs
-        subs = dict_map(lambda t: replacement if t == replaced else t, old_subs)
+            return subs
+        for key in subs.keys_mentioning(replaced):
+            subs[key] = replacement
         subs[replaced] = replacement
         return subs
 
@@ -287,5 +836,241 @@ class Rules:
         return type_spec
 
     def _apply_sub_to_types(self, types, replaced, replacement):
-        replacer = lambda t: self._apply_sub_to_type(t, replaced, replacement)
-        return dict_map(replacer, types)
+        for key in types.keys_mentioning(replaced):
+            types[key] = self._apply_sub_to_type(
+                types[key], replaced, replacement
+            )
+        return types
+
+class Solver:
+    ''' Solves a set of Rules in steps, where each step handles one
+    item from one of the solver's work lists. Between steps the solver
+    can be checkpointed to a file and resumed later with load. '''
+
+    def __init__(self, rules, budget=None, profile=None):
+        # Forking keeps rules added after this out of the solver
+        self._rules = rules.fork()
+        self._budget = budget
+        self._profile = profile
+        self._phase = 'specified'
+        self._after_equal = None
+        self._types = rules._new_indexed_mapping(
+            _type_args, rules._prelude_types()
+        )
+        self._subs = rules._new_indexed_mapping(_replacement_of)
+        # Reversed so the work lists can all be popped from the end
+        self._specified = rules._new_stack(reversed(rules._specified_types))
+        self._equal_rules = rules._new_stack()
+        self._levels = []
+        self._generic_pairs = []
+        self._equality_pairs = []
+        self._instances = defaultdict(set)
+        self._to_resolve = []
+        self._resolved = set()
+        # IDs whose types have changed since the last occurs check
+        self._touched = rules._new_stack()
+
+    def __repr__(self):
+        return 'Solver(phase={}, types={}, subs={})'.format(
+            self._phase, len(self._types), len(self._subs)
+        )
+
+    def __getstate__(self):
+        # The budget and profile belong to the process that is solving
+        state = dict(self.__dict__)
+        state['_budget'] = None
+        state['_profile'] = None
+        return state
+
+    @classmethod
+    def load(cls, path, budget=None, profile=None):
+        with open(path, 'rb') as f:
+            solver = pickle.load(f)
+        if not isinstance(solver, cls):
+            raise Exception('{} is not a solver checkpoint'.format(path))
+        solver._budget = budget
+        solver._profile = profile
+        return solver
+
+    def save(self, path):
+        if self._rules._store is not None:
+            raise Exception(
+                'can\'t checkpoint a solver whose rules are in a store'
+            )
+        # Write to a temporary file first so a crash can't leave a
+        # partly written checkpoint behind
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def is_done(self):
+        return self._phase == 'done'
+
+    def phase(self):
+        return self._phase
+
+    def step(self, n=1):
+        ''' Takes up to `n` steps, returning True once solving is done. '''
+        for _ in range(n):
+            if not self._find_work():
+                break
+            if self._budget is not None:
+                self._budget.step(self._phase)
+            self._STEPS[self._phase](self)
+        return self._find_work() is False
+
+    def run(self):
+        while not self.step(1024):
+            pass
+        return self.result()
+
+    def result(self):
+        if not self.is_done():
+            raise Exception('solver is not done (phase {})'.format(self._phase))
+        return Result(self._types.mapping, self._subs.mapping)
+
+    def _find_work(self):
+        ''' Moves through the phases until the current one has work to
+        do. Returns False once there is nothing left to do. '''
+        while not self._has_work():
+            if self._phase == 'done':
+                return False
+            self._next_phase()
+        return True
+
+    def _has_work(self):
+        if self._phase == 'specified':
+            return bool(self._specified)
+        elif self._phase == 'equal':
+            return bool(self._equal_rules)
+        elif self._phase == 'generic':
+            return bool(self._generic_pairs)
+        elif self._phase == 'class':
+            return bool(self._to_resolve)
+        return False
+
+    def _next_phase(self):
+        rules = self._rules
+        if self._phase in ('specified', 'equal') and self._touched:
+            self._check_for_cycles(self._touched)
+            self._touched = rules._new_stack()
+        if self._phase == 'specified':
+            equal_rules = rules._new_stack(rules._equal_rules)
+            equal_rules.extend(self._equal_rules)
+            self._equal_rules = equal_rules
+            self._phase, self._after_equal = 'equal', 'generic_setup'
+        elif self._phase == 'equal' and self._after_equal == 'generic_setup':
+            self._equal_rules, levels = rules._generic_levels(self._subs)
+            # Reversed so the levels can be popped in order
+            self._levels = levels[::-1]
+            self._after_equal = 'generic_level'
+        elif self._phase == 'equal' and self._levels:
+            self._generic_pairs = self._levels.pop()[::-1]
+            self._equality_pairs = []
+            self._phase = 'generic'
+        elif self._phase == 'equal':
+            # Generals can be replaced after their instances are recorded
+            instances = defaultdict(set)
+            for general, general_instances in self._instances.items():
+                general = self._subs.get(general, general)
+                instances[general].update(general_instances)
+            self._instances = instances
+            self._to_resolve = [
+                (class_name, var)
+                for (var, class_name) in rules._class_constraints
+            ][::-1]
+            self._phase = 'class'
+        elif self._phase == 'generic':
+            self._equal_rules = self._equality_pairs
+            self._equality_pairs = []
+            self._phase = 'equal'
+        else:
+            self._phase = 'done'
+
+    def _step_specified(self):
+        var, given = self._specified.pop()
+        self._touched.append(var)
+        self._rules._collapse_specified_type(
+            var, given, self._types, self._equal_rules
+        )
+
+    def _step_equal(self):
+        t1, t2 = self._equal_rules.pop()
+        self._touched.extend((t1, t2))
+        if self._profile is not None:
+            self._profile.record_merge(t1, t2)
+        self._types, self._subs = self._rules._apply_equal_rule(
+            t1, t2, self._equal_rules, self._types, self._subs
+        )
+
+    def _step_generic(self):
+        instance, general = self._generic_pairs.pop()
+        # The levels were found before earlier levels' equalities were
+        # applied, so either side may have been replaced since
+        instance = self._subs.get(instance, instance)
+        general = self._subs.get(general, general)
+        if self._profile is not None:
+            self._profile.record_walk(instance, general)
+        had_type = instance in self._types
+        self._rules._apply_generic_rule(
+            instance, general, self._generic_pairs, self._equality_pairs,
+            self._types, self._instances, self._budget
+        )
+        # Copying the general's type can make the instance part of its
+        # own type, and then the generic pairs would never run out
+        if not had_type and instance in self._types:
+            self._check_for_cycles([instance])
+
+    def _step_class(self):
+        self._rules._resolve_class(
+            self._to_resolve, self._resolved, self._types, self._subs,
+            self._instances
+        )
+
+    def _check_for_cycles(self, touched):
+        ''' The occurs check. Rather than checking each merge, this looks
+        for cycles in the types once the work list of a phase runs out
+        (or, in the generic phase, whenever an instance gets a type).
+        Any new cycle goes through a type in `touched`, so the search
+        only starts from those. '''
+        subs = self._subs
+        done = set()
+        for start in touched:
+            start = subs.get(start, start)
+            if start in done:
+                continue
+            path = [start]
+            on_path = {start}
+            stack = [iter(self._type_args(start))]
+            while stack:
+                for arg in stack[-1]:
+                    if arg in on_path:
+                        cycle = path[path.index(arg):] + [arg]
+                        raise InferenceError(
+                            'infinite type: {}'.format(
+                                ' -> '.join(map(str, cycle))
+                            )
+                        )
+                    if arg not in done:
+                        path.append(arg)
+                        on_path.add(arg)
+                        stack.append(iter(self._type_args(arg)))
+                        break
+                else:
+                    stack.pop()
+                    done.add(path[-1])
+                    on_path.remove(path.pop())
+
+    def _type_args(self, var):
+        t = self._types.get(var)
+        if not isinstance(t, tuple):
+            return []
+        return [self._subs.get(arg, arg) for arg in t[1:]]
+
+    _STEPS = {
+        'specified': _step_specified,
+        'equal': _step_equal,
+        'generic': _step_generic,
+        'class': _step_class,
+    }
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import os
+import tempfile
 import unittest
 
-from infer import Rules, Registry, InferenceError, Result
+from infer import Rules, Registry, InferenceError, Result, SharedList
+from infer import Budget, BudgetExceededError, CancellationToken, Solver
+from infer import IndexedMapping
 from expression import Literal
 
 class InferTest(unittest.TestCase):
@@ -51,7 +56,17 @@ class InferTest(unittest.TestCase):
 
     def test_accepts_circular_generic_relations(self):
         rules = Rules().specify(1, 'Int').instance_of(1, 2).instance_of(2, 1)
-        self.assertEqual(rules.infer().types.get(2), 'Int')
+        self.assertEqual(rules.infer().get_type_by_id(2), 'Int')
+
+    def test_generic_levels_see_earlier_equalities(self):
+        rules = (
+            Rules().specify('G', ('Fn_1', 'a', 'a')).instance_of('I', 'G')
+            .specify('I', ('Fn_1', 'x', 'y')).specify('x', 'Int')
+            .specify('H2', 'String').instance_of('H2', 'K')
+            .instance_of('y', 'H2')
+        )
+        with self.assertRaises(InferenceError):
+            rules.infer()
 
     def test_applies_recurisve_equality(self):
         rules = (
@@ -152,5 +167,393 @@ class InferTest(unittest.TestCase):
         rules.instance_of(1, 2)
         self.assertEqual(Result({}, {}), rules.infer())
 
+    def test_class_constraint_with_instance(self):
+        rules = (
+            Rules().class_instance('Show', 'Int')
+            .specify(1, 'Int').equal(1, 2).has_class(2, 'Show')
+        )
+        self.assertEqual(Result({1: 'Int'}, {2: 1}), rules.infer())
+
+    def test_class_constraint_without_instance(self):
+        rules = (
+            Rules().class_instance('Show', 'Int')
+            .specify(1, 'Float').has_class(1, 'Show')
+        )
+        with self.assertRaises(InferenceError):
+            rules.infer()
+
+    def test_unresolved_class_constraint(self):
+        rules = Rules().has_class(1, 'Show')
+        self.assertEqual(Result({}, {}), rules.infer())
+
+    def test_class_instance_context(self):
+        rules = (
+            Rules().class_instance('Show', 'Int')
+            .class_instance('Show', 'List', [(0, 'Show')])
+            .specify(1, ('List', 11)).has_class(1, 'Show')
+        )
+        rules.fork().specify(11, 'Int').infer()
+        with self.assertRaises(InferenceError):
+            rules.fork().specify(11, 'Float').infer()
+
+    def test_class_constraint_applies_to_generic_instances(self):
+        rules = (
+            Rules().class_instance('Show', 'Int')
+            .specify(1, ('Fn_1', 11, 12)).has_class(11, 'Show')
+            .specify(2, ('Fn_1', 21, 22)).instance_of(2, 1)
+        )
+        rules.fork().specify(21, 'Int').infer()
+        with self.assertRaises(InferenceError):
+            rules.fork().specify(21, 'String').infer()
+
+    def test_class_constraint_survives_replaced_general(self):
+        rules = (
+            Rules().class_instance('Show', 'Int')
+            .specify(1, ('Fn_1', 11, 12)).has_class(12, 'Show')
+            .specify(2, ('Fn_1', 21, 22)).instance_of(2, 1)
+            .specify(22, 'Float')
+        )
+        # 3 being an instance of 4 makes 11 and 12 equal, replacing 12
+        rules.specify(3, ('Fn_1', 12, 11)).specify(4, ('Fn_1', 41, 41))
+        rules.instance_of(3, 4)
+        with self.assertRaises(InferenceError):
+            rules.infer()
+
+    def test_rejects_overlapping_instances(self):
+        rules = Rules().class_instance('Show', 'Int')
+        with self.assertRaises(Exception):
+            rules.class_instance('Show', 'Int')
+
+    def test_resolves_many_instances(self):
+        rules = Rules()
+        for i in range(1000):
+            rules.class_instance('Show', 'T{}'.format(i))
+        for i in range(1000):
+            rules.specify(i, 'T{}'.format(i)).has_class(i, 'Show')
+        self.assertEqual(1000, len(rules.infer().types))
+
+    def test_partitions(self):
+        rules = (
+            Rules().specify(1, ('Pair', 11, 12)).equal(11, 2)
+            .specify(3, 'Int').equal(3, 4).instance_of(5, 4)
+            .specify(6, 'Float').has_class(12, 'Show')
+        )
+        partitions = rules.partitions()
+        self.assertEqual(3, len(partitions))
+        self.assertEqual(rules.infer(), rules.infer_partitioned())
+
+    def test_partitioned_errors(self):
+        rules = Rules().specify(1, 'Int').specify(2, 'Int').equal(1, 3)
+        rules.specify(3, 'Float')
+        with self.assertRaises(InferenceError):
+            rules.infer_partitioned()
+
+    def test_partitions_in_executors(self):
+        rules = Rules()
+        for i in range(0, 50, 5):
+            rules.specify(i, ('List', i + 1)).specify(i + 1, 'Int')
+            rules.instance_of(i + 2, i).equal(i + 3, i + 2)
+        expected = rules.infer()
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, rules.infer_partitioned(executor))
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            self.assertEqual(
+                expected, rules.infer_partitioned(executor, chunksize=4)
+            )
+
+    def test_dependency_cone(self):
+        rules = (
+            Rules().specify(1, ('Pair', 11, 12)).equal(11, 2)
+            .specify(3, ('List', 13)).equal(3, 4).instance_of(5, 4)
+            .instance_of(6, 4).specify(6, ('List', 'Int'))
+            .specify(7, 'Float').has_class(12, 'Show')
+        )
+        cone = rules.dependency_cone([5])
+        self.assertEqual(
+            [('equal', 3, 4), ('specify', 3, ('List', 13)),
+             ('instance_of', 5, 4)],
+            list(cone.rules())
+        )
+        self.assertEqual(3, len(list(rules.dependency_cone([2]).rules())))
+
+    def test_infer_targets(self):
+        rules = (
+            Rules().specify(1, ('Pair', 11, 12)).equal(11, 2)
+            .specify(3, ('List', 13)).equal(3, 4).instance_of(5, 4)
+            .instance_of(6, 4).specify(6, ('List', 'Int'))
+            .specify(7, 'Float').specify(8, 'Int').equal(7, 8)
+        )
+        with self.assertRaises(InferenceError):
+            rules.infer()
+
+        result = rules.infer(targets=[5, 2])
+        self.assertEqual(('List', 'a0'), result.get_full_type_by_id(5))
+        self.assertEqual(None, result.get_type_by_id(6))
+        self.assertEqual(None, result.get_type_by_id(7))
+        self.assertEqual(
+            Rules().specify(1, ('Pair', 11, 12)).equal(11, 2).infer().types[1],
+            result.get_type_by_id(1)
+        )
+
+    def test_simplify(self):
+        rules = (
+            Rules().class_instance('Show', 'Int')
+            .specify(1, 'Int').specify(1, 'Int').specify(2, 'Int')
+            .equal(1, 2).equal(2, 1).equal(3, 3).equal(2, 3).equal(3, 1)
+            .instance_of(4, 4).instance_of(5, 1).instance_of(5, 1)
+            .has_class(1, 'Show').has_class(1, 'Show')
+        )
+        expected = rules.infer()
+        self.assertEqual(7, rules.simplify())
+        self.assertEqual([(1, 2), (1, 3)], list(rules._equal_rules))
+        self.assertEqual([(1, 'Int'), (2, 'Int')], list(rules._specified_types))
+        self.assertEqual(expected.types[5], rules.infer().types[5])
+        self.assertEqual(0, rules.simplify())
+
+    def test_simplify_groups_specified_types(self):
+        rules = Rules().specify(1, 'Int').specify(2, 'Int').specify(1, 'Float')
+        rules.simplify()
+        self.assertEqual([(1, 'Int'), (1, 'Float'), (2, 'Int')],
+                         list(rules._specified_types))
+
+    def test_infer_within_budget(self):
+        rules = Rules().specify(1, 'Int').equal(1, 2)
+        self.assertEqual(
+            Result({1: 'Int'}, {2: 1}), rules.infer(max_steps=10, timeout=10)
+        )
+
+    def test_step_budget(self):
+        rules = Rules()
+        for i in range(100):
+            rules.equal(i, i + 1)
+        with self.assertRaises(BudgetExceededError) as cm:
+            rules.infer(max_steps=10)
+        self.assertNotIsInstance(cm.exception, InferenceError)
+        self.assertEqual(11, cm.exception.stats['steps'])
+        self.assertEqual({'equal': 11}, cm.exception.stats['phase_steps'])
+        self.assertEqual(100, len(rules.infer().subs))
+
+    def test_deadline(self):
+        rules = Rules()
+        for i in range(200):
+            rules.equal(i, i + 1)
+        with self.assertRaises(BudgetExceededError) as cm:
+            rules.infer(timeout=-1)
+        self.assertEqual('deadline passed', cm.exception.reason)
+
+    def test_cancellation(self):
+        token = CancellationToken()
+        rules = Rules().specify(1, 'Int').instance_of(2, 1)
+        rules.infer(cancel=token)
+        token.cancel()
+        with self.assertRaises(BudgetExceededError) as cm:
+            rules.infer(cancel=token)
+        self.assertEqual('cancelled', cm.exception.reason)
+
+    def test_specified_types_are_merged_in_order(self):
+        rules = Rules().specify(1, ('List', 11)).specify(1, ('List', 12))
+        self.assertEqual(Result({1: ('List', 11)}, {12: 11}), rules.infer())
+
+    def _stepped_rules(self):
+        return (
+            Rules().class_instance('Show', 'Int')
+            .specify(1, ('List', 11)).specify(11, 'Int')
+            .instance_of(2, 1).instance_of(3, 1).equal(3, 4)
+            .has_class(11, 'Show')
+        )
+
+    def test_solver_steps(self):
+        rules = self._stepped_rules()
+        solver = rules.solver()
+        phases = []
+        while not solver.step(1):
+            phases.append(solver.phase())
+        self.assertTrue(solver.is_done())
+        self.assertEqual(rules.infer(), solver.result())
+        self.assertEqual(['specified', 'equal', 'generic', 'class'],
+                         list(dict.fromkeys(phases)))
+
+    def test_solver_ignores_later_rules(self):
+        rules = Rules().specify(1, 'Int')
+        solver = rules.solver()
+        rules.specify(1, 'Bool').equal(1, 2)
+        self.assertEqual(Result({1: 'Int'}, {}), solver.run())
+
+    def test_unfinished_solver_has_no_result(self):
+        solver = self._stepped_rules().solver()
+        solver.step(2)
+        with self.assertRaises(Exception):
+            solver.result()
+
+    def test_solver_checkpoints(self):
+        rules = self._stepped_rules()
+        solver = rules.solver()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'solver.ckpt')
+            for n in range(100):
+                solver.save(path)
+                solver = Solver.load(path)
+                if solver.step(1):
+                    break
+        self.assertEqual(rules.infer(), solver.result())
+
+    def test_solver_errors(self):
+        solver = Rules().specify(1, 'Int').specify(2, 'Bool').equal(1, 2).solver()
+        with self.assertRaises(InferenceError):
+            solver.run()
+
+    def test_prune(self):
+        result = (
+            Rules().specify(1, ('Pair', 11, 12)).specify(11, 'Int')
+            .equal(12, 13).equal(2, 1).specify(3, 'Float').equal(4, 3)
+            .infer()
+        )
+        pruned, saved = result.prune([2])
+        self.assertEqual(
+            Result({1: ('Pair', 11, 12), 11: 'Int'}, {2: 1}), pruned
+        )
+        self.assertGreater(saved, 0)
+        self.assertEqual((result, 0), result.prune(list(result.types) +
+                                                   list(result.subs)))
+
+    def test_generic_index(self):
+        rules = (
+            Rules().instance_of(1, 2).instance_of(2, 3).equal(4, 3)
+            .instance_of(5, 4).specify(3, 'Int')
+        )
+        index = rules.generic_index()
+        self.assertTrue(index.reaches(1, 3))
+        self.assertFalse(index.reaches(3, 1))
+        self.assertFalse(index.reaches(1, 4))
+
+        result = rules.infer()
+        subbed_index = rules.generic_index(result)
+        self.assertTrue(subbed_index.reaches(1, result.subs.get(4, 4)))
+
+    def test_equality_pairs_are_sorted(self):
+        pairs = Rules()._equality_pairs_from_set({'b', 3, 'a', 1})
+        self.assertEqual([(1, 3), (1, 'a'), (1, 'b')], pairs)
+
+    def test_occurs_check(self):
+        with self.assertRaisesRegex(InferenceError, 'infinite type: 1 -> 1'):
+            Rules().specify(1, ('List', 1)).infer()
+        rules = (
+            Rules().specify(1, ('Pair', 2, 3)).specify(3, ('List', 4))
+            .equal(4, 5).equal(5, 1)
+        )
+        with self.assertRaisesRegex(InferenceError, 'infinite type'):
+            rules.infer()
+
+    def test_occurs_check_within_a_phase(self):
+        rules = Rules().specify(1, ('List', 2)).equal(2, 1).equal(1, 2)
+        with self.assertRaisesRegex(InferenceError, 'infinite type'):
+            rules.infer(max_steps=10000)
+
+    def test_occurs_check_on_long_chains(self):
+        rules = Rules().specify(1, ('Pair', 2, 2)).specify(2, ('List', 3))
+        for i in range(3, 500):
+            rules.specify(i, ('List', i + 1))
+        self.assertEqual(('Pair', 2, 2), rules.infer().types[1])
+        with self.assertRaisesRegex(InferenceError, 'infinite type'):
+            rules.equal(500, 3).infer()
+
+    def test_occurs_check_in_generic_phase(self):
+        # Whether this looped forever used to depend on the order the
+        # generic pairs came out in, so try a few different IDs
+        for offset in range(0, 40, 10):
+            v = [offset + i for i in range(10)]
+            rules = (
+                Rules().instance_of(v[0], v[7]).equal(v[3], v[0])
+                .specify(v[7], ('Fn_1', v[2], v[1])).instance_of(v[9], v[1])
+                .instance_of(v[0], v[5]).instance_of(v[6], v[9])
+                .instance_of(v[0], v[2]).specify(v[7], ('Fn_1', v[8], v[0]))
+                .instance_of(v[3], v[1])
+            )
+            with self.assertRaisesRegex(InferenceError, 'infinite type'):
+                rules.infer(max_steps=10000)
+
+    def test_generic_walk_visits_pairs_once(self):
+        # Every argument is the same variable, so without remembering
+        # the pairs already walked the walk would be exponential
+        types = {1: ('Pair', 100, 100), 2: ('Pair', 200, 200)}
+        for i in range(30):
+            types[100 + i] = ('Pair', 101 + i, 101 + i)
+            types[200 + i] = ('Pair', 201 + i, 201 + i)
+        budget = Budget(max_steps=100)
+        pairs = Rules()._walk_for_equality_pairs(types, 1, 2, budget)
+        self.assertEqual([], pairs)
+
+    def test_indexed_mapping(self):
+        mapping = IndexedMapping({}, {}, lambda t: t[1:], {1: ('Pair', 2, 3)})
+        mapping[4] = ('List', 2)
+        self.assertEqual([1, 4], sorted(mapping.keys_mentioning(2)))
+        mapping[1] = ('List', 3)
+        self.assertEqual([4], mapping.keys_mentioning(2))
+        del mapping[4]
+        self.assertEqual([], mapping.keys_mentioning(2))
+        self.assertEqual(1, mapping.count_mentioning(3))
+        self.assertEqual({1: ('List', 3)}, dict(mapping))
+
+    def test_shared_list_forks_are_independent(self):
+        items = SharedList()
+        items.append(1)
+        forked = items.fork()
+        items.append(2)
+        forked.append(3)
+        self.assertEqual([1, 2], list(items))
+        self.assertEqual([1, 3], list(forked))
+        self.assertEqual(2, len(forked))
+
+    def test_forked_rules_dont_affect_original(self):
+        rules = Rules().specify(1, 'Int').equal(1, 2)
+        forked = rules.fork()
+        forked.specify(2, 'Float')
+        with self.assertRaises(InferenceError):
+            forked.infer()
+        self.assertEqual(Result({1: 'Int'}, {2: 1}), rules.infer())
+
+    def test_original_rules_dont_affect_fork(self):
+        rules = Rules().specify(1, 'Int')
+        forked = rules.fork()
+        rules.instance_of(2, 1)
+        forked.equal(1, 3)
+        self.assertEqual(Result({1: 'Int'}, {3: 1}), forked.infer())
+        self.assertEqual(Result({1: 'Int', 2: 'Int'}, {}), rules.infer())
+
+    def test_forks_of_forks(self):
+        rules = Rules().specify(1, 'Int')
+        variants = [rules.fork().specify(i, 'Int').equal(1, i)
+                    for i in range(2, 5)]
+        nested = variants[0].fork().specify(10, 'Bool')
+        self.assertEqual(Result({1: 'Int'}, {2: 1}), variants[0].infer())
+        self.assertEqual(Result({1: 'Int'}, {4: 1}), variants[2].infer())
+        self.assertEqual(
+            Result({1: 'Int', 10: 'Bool'}, {2: 1}), nested.infer()
+        )
+
+    def test_forked_registry_is_independent(self):
+        registry = Registry()
+        registry.push_new_scope({'x': ('var_x_1', False)})
+        id1 = registry.add_to_registry('x')
+        forked = registry.fork()
+        id2 = forked.add_to_registry('y')
+        forked.push_new_scope({'z': ('var_z_3', False)})
+        id3 = registry.add_to_registry('z')
+
+        self.assertEqual(id2, id3)
+        self.assertEqual('x', forked.get_registered()[id1])
+        self.assertEqual('y', forked.get_registered()[id2])
+        self.assertEqual('z', registry.get_registered()[id3])
+        self.assertEqual(None, registry.get_id_for('y'))
+        self.assertEqual(None, registry.lookup_var_in_scope('z'))
+        self.assertEqual(('var_x_1', False), forked.lookup_var_in_scope('x'))
+
+    def test_repeated_forks_dont_nest(self):
+        registry = Registry()
+        registry.add_to_registry('x')
+        for _ in range(100):
+            registry.fork()
+        self.assertEqual(2, len(registry.get_registered().maps))
+
 if __name__ == '__main__':
     unittest.main()
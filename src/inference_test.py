@@ -116,6 +116,19 @@ class InferenceTest(unittest.TestCase):
         result = self._rules.infer()
         self.assertEqual('Int', result.get_type_by_id(lt_id))
 
+    def test_self_application_is_infinite(self):
+        ''' ML code:
+        let g = \\x -> x g
+        in g g
+        '''
+        lm = Lambda(['x'], Application(Variable('x'), [Variable('g')]))
+        app = Application(Variable('g'), [Variable('g')])
+        lt = Let([('g', lm)], app)
+        lt.add_to_rules(self._rules, self._registry)
+
+        with self.assertRaisesRegex(InferenceError, 'infinite type'):
+            self._rules.infer(max_steps=10000)
+
     def test_if_statement(self):
         test = Literal('Bool', True)
         if_case = Literal('Int', 123)
@@ -195,6 +208,80 @@ class InferenceTest(unittest.TestCase):
         result = self._rules.infer()
         self.assertEqual(('Fn_1', 'a0', 'a0'), result.get_full_type_by_id(let_id))
 
+    def test_simplify_keeps_results(self):
+        ''' ML code:
+        let x = if True then 1 else 2
+            y = x
+            z = y
+        in z
+        '''
+        if_block = If(Literal('Bool', True), Literal('Int', 1),
+                      Literal('Int', 2))
+        lt = Let([('x', if_block), ('y', Variable('x')), ('z', Variable('y'))],
+                 Variable('z'))
+        lt_id = lt.add_to_rules(self._rules, self._registry)
+        forked = self._rules.fork()
+        # The if's test is specified as Bool twice
+        self.assertEqual(1, forked.simplify())
+
+        expected, actual = self._rules.infer(), forked.infer()
+        for expr_id in self._registry.get_registered():
+            self.assertEqual(expected.get_full_type_by_id(expr_id),
+                             actual.get_full_type_by_id(expr_id))
+        self.assertEqual('Int', actual.get_type_by_id(lt_id))
+
+    def test_prune_to_registered_expressions(self):
+        ''' ML code:
+        let id = \\x -> x
+        in id (id 1)
+        '''
+        lt = Let(
+            [('id', Lambda(['x'], Variable('x')))],
+            Application(Variable('id'), [
+                Application(Variable('id'), [Literal('Int', 1)]),
+            ])
+        )
+        lt_id = lt.add_to_rules(self._rules, self._registry)
+        result = self._rules.infer()
+        registered = self._registry.get_registered()
+
+        pruned, saved = result.prune(registered)
+        self.assertGreater(saved, 0)
+        self.assertLess(len(pruned.subs), len(result.subs))
+        for expr_id in registered:
+            self.assertEqual(result.get_full_type_by_id(expr_id),
+                             pruned.get_full_type_by_id(expr_id))
+
+        only_let, _ = result.prune([lt_id])
+        self.assertEqual(['Int'], list(only_let.types.values()))
+
+    def test_infer_targets_skips_unused_bindings(self):
+        ''' ML code:
+        let bad = if True then 1 else False
+            x = 2
+        in x
+        '''
+        lt = Let(
+            [('bad', If(Literal('Bool', True), Literal('Int', 1),
+                        Literal('Bool', False))),
+             ('x', Literal('Int', 2))],
+            Variable('x')
+        )
+        lt_id = lt.add_to_rules(self._rules, self._registry)
+        with self.assertRaises(InferenceError):
+            self._rules.infer()
+        result = self._rules.infer(targets=[lt_id])
+        self.assertEqual('Int', result.get_type_by_id(lt_id))
+
+    def test_self_application_is_infinite(self):
+        ''' ML code:
+        \\x -> x x
+        '''
+        lm = Lambda(['x'], Application(Variable('x'), [Variable('x')]))
+        lm.add_to_rules(self._rules, self._registry)
+        with self.assertRaisesRegex(InferenceError, 'infinite type'):
+            self._rules.infer()
+
 
 '''
 TODO: test this:
@@ -0,0 +1,94 @@
+''' Separate compilation: a module is a top-level Let, and its interface
+is the generalized type of each of the Let's bindings. Interfaces can be
+saved, and then imported as globals when inferring other modules, so
+those modules don't have to re-solve the code they depend on. '''
+
+import json
+import os
+
+from infer import InferenceError
+from prelude import Prelude
+
+FORMAT_VERSION = 1
+
+def export_interface(module_name, let_expr, registry, result):
+    bindings = {}
+    for name, expr in let_expr.get_bindings():
+        expr_id = registry.get_id_for(expr)
+        if expr_id is None:
+            raise Exception('binding {} is not registered'.format(name))
+        bindings[name] = generalized_type(result, expr_id)
+    return {'module': module_name, 'bindings': bindings}
+
+def generalized_type(result, expr_id):
+    ''' Returns the type of `expr_id` in the format Prelude.define
+    takes, with each type variable given a lowercase name. '''
+    var_names = {}
+    return _signature(result, expr_id, var_names, set())
+
+def _signature(result, type_id, var_names, in_progress):
+    type_id = result.subs.get(type_id, type_id)
+    t = result.types.get(type_id)
+    if t is None:
+        if type_id not in var_names:
+            var_names[type_id] = _var_name(len(var_names))
+        return var_names[type_id]
+    if not isinstance(t, tuple):
+        return t
+
+    if type_id in in_progress:
+        raise InferenceError('type of {} is infinite'.format(type_id))
+    in_progress.add(type_id)
+    arg_types = [
+        _signature(result, arg, var_names, in_progress) for arg in t[1:]
+    ]
+    in_progress.remove(type_id)
+    return tuple([t[0]] + arg_types)
+
+def _var_name(n):
+    if n < 26:
+        return chr(ord('a') + n)
+    return 't{}'.format(n)
+
+def save_interface(interface, path):
+    data = {
+        'version': FORMAT_VERSION,
+        'module': interface['module'],
+        'bindings': interface['bindings'],
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def load_interface(path):
+    with open(path) as f:
+        data = json.load(f)
+    if data.get('version') != FORMAT_VERSION:
+        raise Exception('{} has an unsupported interface version'.format(path))
+    return {
+        'module': data['module'],
+        'bindings': {
+            name: _from_json(signature)
+            for name, signature in data['bindings'].items()
+        },
+    }
+
+def _from_json(signature):
+    if isinstance(signature, list):
+        return tuple(_from_json(part) for part in signature)
+    return signature
+
+def import_interfaces(interfaces, base=None):
+    ''' Returns a frozen prelude with the globals of `base` (if given)
+    and the bindings of each interface. Pass it to the Rules and
+    Registry of the modules that import the interfaces. '''
+    prelude = Prelude() if base is None else base.extend()
+    for interface in interfaces:
+        for name, signature in interface['bindings'].items():
+            if prelude.lookup(name) is not None:
+                raise Exception('{} from module {} is already defined'.format(
+                    name, interface['module']
+                ))
+            prelude.define(name, signature)
+    return prelude.freeze()
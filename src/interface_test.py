@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from expression import Application
+from expression import Lambda
+from expression import Let
+from expression import Literal
+from expression import Variable
+from infer import Rules, Registry, InferenceError, Result
+from interface import export_interface, generalized_type, import_interfaces
+from interface import load_interface, save_interface
+from prelude import default_prelude
+
+def infer_module(let_expr, prelude):
+    rules, registry = Rules(prelude=prelude), Registry(prelude=prelude)
+    let_expr.add_to_rules(rules, registry)
+    return rules.infer(), registry
+
+class InterfaceTest(unittest.TestCase):
+    def setUp(self):
+        ''' ML code:
+        let ident = \\x -> x
+            double = \\x -> x + x
+            first = \\x y -> x
+        in 0
+        '''
+        self._module = Let([
+            ('ident', Lambda(['x'], Variable('x'))),
+            ('double', Lambda(['x'], Application(
+                Variable('+'), [Variable('x'), Variable('x')]
+            ))),
+            ('first', Lambda(['x', 'y'], Variable('x'))),
+        ], Literal('Int', 0))
+        result, registry = infer_module(self._module, default_prelude())
+        self._interface = export_interface(
+            'base', self._module, registry, result
+        )
+
+    def test_exports_generalized_types(self):
+        self.assertEqual({
+            'ident': ('Fn_1', 'a', 'a'),
+            'double': ('Fn_1', 'Int', 'Int'),
+            'first': ('Fn_2', 'a', 'b', 'a'),
+        }, self._interface['bindings'])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'base.json')
+            save_interface(self._interface, path)
+            self.assertEqual(self._interface, load_interface(path))
+
+    def test_imported_interface(self):
+        prelude = import_interfaces([self._interface], default_prelude())
+        ident_str = Application(Variable('ident'), [Literal('String', 's')])
+        double_int = Application(Variable('double'), [Literal('Int', 1)])
+        module = Let([('a', ident_str), ('b', double_int)],
+                     Application(Variable('>'), [Literal('Int', 1), Literal('Int', 2)]))
+        result, registry = infer_module(module, prelude)
+        self.assertEqual('String', result.get_type_by_id(
+            registry.get_id_for(ident_str)
+        ))
+        self.assertEqual('Int', result.get_type_by_id(
+            registry.get_id_for(double_int)
+        ))
+
+    def test_imported_interface_errors(self):
+        prelude = import_interfaces([self._interface])
+        module = Application(Variable('double'), [Literal('String', 's')])
+        with self.assertRaises(InferenceError):
+            infer_module(module, prelude)
+
+    def test_rejects_duplicate_names(self):
+        with self.assertRaises(Exception):
+            import_interfaces([self._interface, self._interface])
+
+    def test_infinite_types(self):
+        with self.assertRaises(InferenceError):
+            generalized_type(Result({1: ('List', 1)}, {}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+from infer import Rules
+
+# Signatures use nested tuples of type constructors. Strings starting
+# with a lowercase letter are type variables, which are generalized
+# over every use of the global.
+BUILTINS = [
+    ('+', ('Fn_2', 'Int', 'Int', 'Int')),
+    ('-', ('Fn_2', 'Int', 'Int', 'Int')),
+    ('*', ('Fn_2', 'Int', 'Int', 'Int')),
+    ('>', ('Fn_2', 'Int', 'Int', 'Bool')),
+    ('<', ('Fn_2', 'Int', 'Int', 'Bool')),
+    ('==', ('Fn_2', 'a', 'a', 'Bool')),
+    ('not', ('Fn_1', 'Bool', 'Bool')),
+]
+
+def global_id(name):
+    return 'global_' + name
+
+def is_type_var(signature):
+    return isinstance(signature, str) and signature[:1].islower()
+
+class Prelude:
+    ''' A set of pre-defined globals. The prelude is solved once when
+    it is frozen, and after that it is only ever read, so one instance
+    can be shared by any number of Rules and Registries (and by
+    processes forked after it was frozen). '''
+
+    def __init__(self):
+        self._rules = Rules()
+        self._globals = {}
+        self._global_ids = set()
+        self._signatures = {}
+        # Numbers the parts of the signature being defined
+        self._next_id = 1
+        # Maps each global's ID to the types its signature needs
+        self._closures = None
+
+    def __repr__(self):
+        return 'Prelude(globals={}, frozen={})'.format(
+            sorted(self._globals), self.is_frozen()
+        )
+
+    def is_frozen(self):
+        return self._closures is not None
+
+    def define(self, name, signature):
+        if self.is_frozen():
+            raise Exception('can\'t define {}, prelude is frozen'.format(name))
+        if name in self._globals:
+            raise Exception('{} is already defined'.format(name))
+
+        id_ = global_id(name)
+        self._globals[name] = id_
+        self._global_ids.add(id_)
+        self._signatures[name] = signature
+        self._next_id = 1
+        if not is_type_var(signature):
+            self._specify_signature(id_, id_, signature, {})
+        return self
+
+    def extend(self):
+        ''' Returns an unfrozen prelude with the same globals, so that
+        more can be defined without changing this one. '''
+        extended = Prelude()
+        for name, signature in self._signatures.items():
+            extended.define(name, signature)
+        return extended
+
+    def signatures(self):
+        return dict(self._signatures)
+
+    def freeze(self):
+        if self.is_frozen():
+            return self
+        result = self._rules.infer()
+        self._closures = {
+            id_: self._type_closure(result, id_)
+            for id_ in self._globals.values()
+        }
+        # The constraints are not needed once the prelude is solved
+        self._rules = None
+        return self
+
+    def is_global(self, id_):
+        return id_ in self._global_ids
+
+    def lookup(self, name):
+        return self._globals.get(name, None)
+
+    def types_for(self, ids):
+        ''' Returns a fresh dict with the solved types needed by any
+        of the globals in `ids`. IDs that aren't globals are ignored. '''
+        if not self.is_frozen():
+            raise Exception('prelude must be frozen before it is used')
+        types = {}
+        for id_ in ids:
+            closure = self._closures.get(id_)
+            if closure is not None:
+                types.update(closure)
+        return types
+
+    def _specify_signature(self, root_id, id_, signature, var_ids):
+        if isinstance(signature, tuple):
+            arg_ids = [
+                self._signature_id(root_id, arg, var_ids)
+                for arg in signature[1:]
+            ]
+            self._rules.specify(id_, tuple([signature[0]] + arg_ids))
+        else:
+            self._rules.specify(id_, signature)
+
+    def _signature_id(self, root_id, signature, var_ids):
+        if is_type_var(signature):
+            if signature not in var_ids:
+                var_ids[signature] = '{}.{}'.format(root_id, signature)
+            return var_ids[signature]
+
+        id_ = '{}.{}'.format(root_id, self._next_id)
+        self._next_id += 1
+        self._specify_signature(root_id, id_, signature, var_ids)
+        return id_
+
+    def _type_closure(self, result, id_):
+        closure = {}
+        to_visit = [id_]
+        while to_visit:
+            var = to_visit.pop()
+            if var in closure:
+                continue
+            t = result.get_type_by_id(var)
+            if t is None:
+                continue
+            closure[var] = t
+            if isinstance(t, tuple):
+                to_visit.extend(t[1:])
+        return closure
+
+_default_prelude = None
+
+def default_prelude():
+    ''' The frozen prelude of BUILTINS, created on first use. '''
+    global _default_prelude
+    if _default_prelude is None:
+        prelude = Prelude()
+        for name, signature in BUILTINS:
+            prelude.define(name, signature)
+        _default_prelude = prelude.freeze()
+    return _default_prelude
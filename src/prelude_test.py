@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from expression import Application
+from expression import Let
+from expression import Literal
+from expression import Variable
+from infer import Rules, Registry, InferenceError
+from prelude import Prelude, default_prelude
+
+class PreludeTest(unittest.TestCase):
+    def setUp(self):
+        self._prelude = default_prelude()
+        self._rules = Rules(prelude=self._prelude)
+        self._registry = Registry(prelude=self._prelude)
+
+    def test_default_prelude_is_shared(self):
+        self.assertIs(default_prelude(), default_prelude())
+        self.assertTrue(default_prelude().is_frozen())
+
+    def test_cant_define_in_frozen_prelude(self):
+        with self.assertRaises(Exception):
+            self._prelude.define('foo', 'Int')
+
+    def test_cant_define_twice(self):
+        prelude = Prelude().define('foo', 'Int')
+        with self.assertRaises(Exception):
+            prelude.define('foo', 'Int')
+
+    def test_extend_frozen_prelude(self):
+        extended = self._prelude.extend().define('foo', 'Int').freeze()
+        self.assertEqual('global_>', extended.lookup('>'))
+        self.assertEqual('global_foo', extended.lookup('foo'))
+        self.assertEqual(None, self._prelude.lookup('foo'))
+
+    def test_must_be_frozen_before_use(self):
+        prelude = Prelude().define('foo', 'Int')
+        with self.assertRaises(Exception):
+            prelude.types_for(['global_foo'])
+
+    def test_lookup_falls_back_to_prelude(self):
+        self.assertEqual(('global_>', True),
+                         self._registry.lookup_var_in_scope('>'))
+        self.assertEqual(None, self._registry.lookup_var_in_scope('nope'))
+
+    def test_local_bindings_shadow_globals(self):
+        self._registry.push_new_scope({'>': ('var_>_1', False)})
+        self.assertEqual(('var_>_1', False),
+                         self._registry.lookup_var_in_scope('>'))
+
+    def test_only_used_globals_are_loaded(self):
+        types = self._prelude.types_for(['global_not', 123])
+        self.assertEqual(
+            {'global_not': ('Fn_1', 'global_not.1', 'global_not.2'),
+             'global_not.1': 'Bool',
+             'global_not.2': 'Bool'},
+            types
+        )
+
+    def test_uses_builtin(self):
+        app = Application(Variable('>'),
+                          [Literal('Int', 1), Literal('Int', 2)])
+        app_id = app.add_to_rules(self._rules, self._registry)
+        result = self._rules.infer()
+        self.assertEqual('Bool', result.get_type_by_id(app_id))
+
+    def test_catches_misuse_of_generic_builtin(self):
+        app = Application(Variable('=='),
+                          [Literal('Int', 1), Literal('String', 'a')])
+        app.add_to_rules(self._rules, self._registry)
+        with self.assertRaises(InferenceError):
+            self._rules.infer()
+
+    def test_catches_misuse_of_builtin(self):
+        app = Application(Variable('not'), [Literal('Int', 1)])
+        app.add_to_rules(self._rules, self._registry)
+        with self.assertRaises(InferenceError):
+            self._rules.infer()
+
+    def test_generic_builtin(self):
+        eq_ints = Application(Variable('=='),
+                              [Literal('Int', 1), Literal('Int', 2)])
+        eq_strs = Application(Variable('=='),
+                              [Literal('String', 'a'), Literal('String', 'b')])
+        lt = Let([('x', eq_ints), ('y', eq_strs)], Literal('Int', 0))
+        lt.add_to_rules(self._rules, self._registry)
+        result = self._rules.infer()
+        for app in [eq_ints, eq_strs]:
+            app_id = self._registry.get_id_for(app)
+            self.assertEqual('Bool', result.get_type_by_id(app_id))
+
+    def test_runs_dont_change_the_prelude(self):
+        before = self._prelude.types_for(['global_=='])
+        app = Application(Variable('=='),
+                          [Literal('Int', 1), Literal('Int', 2)])
+        app.add_to_rules(self._rules, self._registry)
+        self._rules.infer()
+        self.assertEqual(before, self._prelude.types_for(['global_==']))
+
+    def test_globals_dont_join_partitions(self):
+        for i in range(3):
+            app = Application(Variable('=='),
+                              [Literal('Int', i), Literal('Int', i)])
+            app.add_to_rules(self._rules, self._registry)
+        self.assertEqual(3, len(self._rules.partitions()))
+        self.assertEqual(self._rules.infer(), self._rules.infer_partitioned())
+
+    def test_nested_signatures(self):
+        prelude = Prelude().define('head', ('Fn_1', ('List', 'a'), 'a'))
+        prelude.freeze()
+        rules = Rules(prelude=prelude)
+        registry = Registry(prelude=prelude)
+        lst = Variable('xs')
+        registry.push_new_scope({'xs': ('var_xs_1', False)})
+        rules.specify('var_xs_1', ('List', 'elem')).specify('elem', 'Int')
+        app_id = Application(Variable('head'), [lst]).add_to_rules(
+            rules, registry
+        )
+        self.assertEqual('Int', rules.infer().get_type_by_id(app_id))
+
+if __name__ == '__main__':
+    unittest.main()
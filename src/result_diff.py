@@ -0,0 +1,40 @@
+''' Compares the results of inferring two versions of a program, so that
+code that uses the types only has to redo the expressions whose types
+changed.
+
+Expressions are matched by identity: an edited program is expected to
+reuse the expression objects it didn't change. IDs and type variables
+are not compared directly, since they depend on the order things were
+registered and solved. Instead each type is normalized: its type
+variables are renamed a, b, ... in the order they first appear in it. '''
+
+from collections import namedtuple
+
+from interface import generalized_type
+
+class ResultDiff(namedtuple('ResultDiff', 'added removed changed')):
+    ''' `added` and `removed` map expressions to their types, and
+    `changed` maps expressions to (old type, new type) pairs. '''
+
+    def is_empty(self):
+        return not (self.added or self.removed or self.changed)
+
+def normalize(result, registry):
+    ''' Returns a dict from each expression in `registry` to its type in
+    `result`, with canonically named type variables. '''
+    return {
+        expr: generalized_type(result, expr_id)
+        for expr_id, expr in registry.get_registered().items()
+    }
+
+def diff_results(old_result, old_registry, new_result, new_registry):
+    old = normalize(old_result, old_registry)
+    new = normalize(new_result, new_registry)
+    added = {expr: t for expr, t in new.items() if expr not in old}
+    removed = {expr: t for expr, t in old.items() if expr not in new}
+    changed = {
+        expr: (old[expr], t)
+        for expr, t in new.items()
+        if expr in old and old[expr] != t
+    }
+    return ResultDiff(added, removed, changed)
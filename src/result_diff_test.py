@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from expression import Application
+from expression import Lambda
+from expression import Let
+from expression import Literal
+from expression import Variable
+from infer import Registry, Result, Rules
+from result_diff import diff_results, normalize
+
+def infer(expr, first_id=1):
+    rules, registry = Rules(), Registry()
+    for _ in range(first_id - 1):
+        registry.generate_new_id()
+    expr.add_to_rules(rules, registry)
+    return rules.infer(), registry
+
+class ResultDiffTest(unittest.TestCase):
+    def test_normalize_ignores_ids(self):
+        lam = Lambda(['x'], Variable('x'))
+        lam_copy = Lambda(['x'], Variable('x'))
+        result, registry = infer(lam)
+        other_result, other_registry = infer(lam_copy, first_id=100)
+        self.assertEqual(('Fn_1', 'a', 'a'), normalize(result, registry)[lam])
+        self.assertEqual(
+            sorted(map(repr, normalize(result, registry).values())),
+            sorted(map(repr, normalize(other_result, other_registry).values()))
+        )
+
+    def test_normalize_ignores_variable_ids(self):
+        registry = Registry()
+        expr = Variable('f')
+        registry.register_for_id(1, expr)
+        result = Result({1: ('Pair', 3, 2, 3)}, {})
+        renumbered = Result({1: ('Pair', 7, 9, 7)}, {})
+        self.assertEqual(normalize(result, registry),
+                         normalize(renumbered, registry))
+
+    def test_diff(self):
+        generic = Lambda(['x'], Variable('x'))
+        applied = Lambda(['y'], Variable('y'))
+        old_arg = Literal('Int', 2)
+        new_arg = Literal('Bool', True)
+
+        def program(arg):
+            return Let([('f', generic)], Application(applied, [arg]))
+
+        old_result, old_registry = infer(program(old_arg))
+        new_result, new_registry = infer(program(new_arg), first_id=50)
+        diff = diff_results(old_result, old_registry, new_result, new_registry)
+
+        self.assertEqual('Int', diff.removed[old_arg])
+        self.assertEqual('Bool', diff.added[new_arg])
+        self.assertEqual(
+            (('Fn_1', 'Int', 'Int'), ('Fn_1', 'Bool', 'Bool')),
+            diff.changed[applied]
+        )
+        self.assertNotIn(generic, diff.changed)
+        self.assertFalse(diff.is_empty())
+
+        same = diff_results(old_result, old_registry, old_result, old_registry)
+        self.assertTrue(same.is_empty())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+''' A long-running inference server that speaks JSON lines.
+
+Each request is an object like {"id": 1, "expr": EXPR} where EXPR is
+one of
+
+    ["lit", type, value]
+    ["var", name]
+    ["app", fn_expr, [arg_expr, ...]]
+    ["lambda", [name, ...], body_expr]
+    ["let", [[name, expr], ...], body_expr]
+    ["if", test_expr, if_expr, else_expr]
+    ["typed", type, expr]
+
+and each response is {"id": 1, "type": TYPE, "latency_ms": ...} or
+{"id": 1, "error": message, "latency_ms": ...}. Requests that arrive
+close together are inferred together with a single call to Rules.infer.
+'''
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import json
+import sys
+import time
+
+from expression import Application
+from expression import If
+from expression import Lambda
+from expression import Let
+from expression import Literal
+from expression import TypedExpression
+from expression import Variable
+from infer import Rules, Registry, InferenceError, BudgetExceededError
+from prelude import default_prelude
+
+class RequestError(Exception):
+    pass
+
+def decode_expression(data):
+    if not isinstance(data, list) or not data:
+        raise RequestError('invalid expression: {!r}'.format(data))
+    kind, args = data[0], data[1:]
+    decoder = _DECODERS.get(kind)
+    if decoder is None:
+        raise RequestError('unknown expression kind: {!r}'.format(kind))
+    try:
+        return decoder(*args)
+    except RecursionError:
+        raise RequestError('expression is nested too deeply')
+    except (TypeError, ValueError, IndexError):
+        raise RequestError('invalid {} expression: {!r}'.format(kind, data))
+
+_DECODERS = {
+    'lit': Literal,
+    'var': Variable,
+    'app': lambda fn, args: Application(
+        decode_expression(fn), [decode_expression(a) for a in args]
+    ),
+    'lambda': lambda names, body: Lambda(names, decode_expression(body)),
+    'let': lambda bindings, body: Let(
+        [(name, decode_expression(expr)) for (name, expr) in bindings],
+        decode_expression(body)
+    ),
+    'if': lambda test, if_case, else_case: If(
+        decode_expression(test),
+        decode_expression(if_case),
+        decode_expression(else_case)
+    ),
+    'typed': lambda t, expr: TypedExpression(t, decode_expression(expr)),
+}
+
+def encode_type(t):
+    if isinstance(t, tuple):
+        return [encode_type(part) for part in t]
+    return t
+
+def infer_batch(programs, prelude=None, timeout=None):
+    ''' Infers the type of each program (an expression in its JSON
+    form), returning an ('ok', type), ('error', message) or ('timeout',
+    message) pair for each. All the programs share one Rules so that a
+    batch only needs one call to infer, unless one of them has a type
+    error. If solving takes longer than `timeout` seconds in all, every
+    program that isn't done yet times out. '''
+    deadline = None if timeout is None else time.monotonic() + timeout
+    return _infer_batch(programs, prelude, deadline)
+
+def _infer_batch(programs, prelude, deadline):
+    if prelude is None:
+        prelude = default_prelude()
+    rules = Rules(prelude=prelude)
+    registry = Registry(prelude=prelude)
+
+    outcomes = []
+    root_ids = []
+    for program in programs:
+        # Add each program to a fork so a program that fails part way
+        # through doesn't leave half of its rules behind.
+        forked_rules, forked_registry = rules.fork(), registry.fork()
+        try:
+            expr = decode_expression(program)
+            root_id = expr.add_to_rules(forked_rules, forked_registry)
+        except (RequestError, InferenceError) as e:
+            error = str(e)
+        except RecursionError:
+            error = 'expression is nested too deeply'
+        except (TypeError, ValueError, IndexError) as e:
+            # Decoding can't catch every malformed program
+            error = 'invalid program: {}'.format(e)
+        else:
+            rules, registry = forked_rules, forked_registry
+            outcomes.append(None)
+            root_ids.append(root_id)
+            continue
+        outcomes.append(('error', error))
+        root_ids.append(None)
+
+    try:
+        result = rules.infer(timeout=_remaining(deadline))
+    except BudgetExceededError as e:
+        return [outcome or ('timeout', str(e)) for outcome in outcomes]
+    except InferenceError as e:
+        if len(programs) == 1:
+            return [outcomes[0] or ('error', str(e))]
+        # Infer separately to find out which of the programs failed
+        return [
+            outcome or _infer_batch([program], prelude, deadline)[0]
+            for (program, outcome) in zip(programs, outcomes)
+        ]
+
+    return [
+        outcome or ('ok', encode_type(result.get_full_type_by_id(root_id)))
+        for (outcome, root_id) in zip(outcomes, root_ids)
+    ]
+
+def _remaining(deadline):
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+class InferenceServer:
+    def __init__(self, executor=None, batch_window=0.002, max_batch=64,
+                 cache_size=1024, timeout=None):
+        # Loading the prelude up front keeps it out of request latency
+        default_prelude()
+        self._executor = executor
+        self._timeout = timeout
+        self._batch_window = batch_window
+        self._max_batch = max_batch
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._pending = []
+        self._flush_handle = None
+        self.stats = collections.Counter()
+
+    async def handle(self, request):
+        start = time.perf_counter()
+        response = {'id': request.get('id')}
+        if 'expr' in request:
+            status, value = await self._lookup(request['expr'])
+        else:
+            status, value = 'error', 'request has no expr'
+        response['type' if status == 'ok' else 'error'] = value
+        response['latency_ms'] = (time.perf_counter() - start) * 1000
+        self.stats['requests'] += 1
+        return response
+
+    async def handle_line(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'id': None, 'error': 'invalid JSON: {}'.format(e)}
+        if not isinstance(request, dict):
+            return {'id': None, 'error': 'request must be an object'}
+        return await self.handle(request)
+
+    async def serve(self, reader, writer):
+        ''' Answers requests from `reader` until it is closed. Requests
+        are handled concurrently, so responses may be out of order. '''
+        tasks = set()
+
+        async def respond(line):
+            response = await self.handle_line(line)
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            task = asyncio.ensure_future(respond(line))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        if isinstance(writer, asyncio.StreamWriter):
+            writer.close()
+            await writer.wait_closed()
+
+    async def _lookup(self, program):
+        key = json.dumps(program, sort_keys=True)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats['cache_hits'] += 1
+            return self._cache[key]
+
+        outcome = await self._enqueue(program)
+        # Timeouts and failed batches may not happen next time
+        if outcome[0] in ('timeout', 'failed'):
+            return ('error', outcome[1])
+        self._cache[key] = outcome
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return outcome
+
+    def _enqueue(self, program):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((program, future))
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self._batch_window, self._flush
+            )
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        self.stats['batches'] += 1
+        programs = [program for (program, _) in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            outcomes = await loop.run_in_executor(
+                self._executor,
+                functools.partial(infer_batch, programs, timeout=self._timeout)
+            )
+        except Exception as e:
+            outcomes = [('failed', str(e))] * len(batch)
+        for (_, future), outcome in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(outcome)
+
+class _StdoutWriter:
+    ''' Writes responses straight to stdout, which (unlike a pipe
+    transport) works whether stdout is a pipe, a terminal or a file. '''
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+
+    async def drain(self):
+        pass
+
+async def _serve_stdio(server):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+    )
+    await server.serve(reader, _StdoutWriter())
+
+async def _serve_socket(server, path):
+    unix_server = await asyncio.start_unix_server(server.serve, path=path)
+    async with unix_server:
+        await unix_server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--socket', help='listen on this Unix socket '
+                        'instead of stdin and stdout')
+    parser.add_argument('--timeout', type=float,
+                        help='give up on a batch after this many seconds')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='size of the worker process pool (by default '
+                        'inference runs in a thread)')
+    args = parser.parse_args()
+
+    executor = None
+    if args.workers:
+        executor = concurrent.futures.ProcessPoolExecutor(args.workers)
+        # Start the workers now so the first requests don't wait for them
+        list(executor.map(infer_batch, [[]] * args.workers))
+    server = InferenceServer(executor=executor, timeout=args.timeout)
+
+    if args.socket:
+        asyncio.run(_serve_socket(server, args.socket))
+    else:
+        asyncio.run(_serve_stdio(server))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+import asyncio
+import concurrent.futures
+import json
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from server import InferenceServer, decode_expression, infer_batch
+
+ID_PROGRAM = ['let', [['id', ['lambda', ['x'], ['var', 'x']]]],
+              ['app', ['var', 'id'], [['lit', 'String', 'foo']]]]
+BAD_PROGRAM = ['if', ['lit', 'Int', 1], ['lit', 'Int', 2], ['lit', 'Int', 3]]
+
+class CollectingWriter:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data):
+        self.lines.append(json.loads(data))
+
+    async def drain(self):
+        pass
+
+class BrokenExecutor(concurrent.futures.Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        future.set_exception(Exception('worker died'))
+        return future
+
+class SteppingClock:
+    ''' A clock that moves forward by `step` seconds each time it's read. '''
+
+    def __init__(self, step):
+        self._step = step
+        self._now = 0
+
+    def monotonic(self):
+        now = self._now
+        self._now += self._step
+        return now
+
+class InferBatchTest(unittest.TestCase):
+    def test_decodes_expressions(self):
+        self.assertEqual(
+            'Application(Variable(>), [Literal(Int, 1), Literal(Int, 2)])',
+            repr(decode_expression(
+                ['app', ['var', '>'], [['lit', 'Int', 1], ['lit', 'Int', 2]]]
+            ))
+        )
+
+    def test_infers_each_program(self):
+        outcomes = infer_batch([
+            ID_PROGRAM,
+            ['lambda', ['x'], ['var', 'x']],
+            ['app', ['var', '>'], [['lit', 'Int', 1], ['lit', 'Int', 2]]],
+        ])
+        self.assertEqual([
+            ('ok', 'String'),
+            ('ok', ['Fn_1', 'a0', 'a0']),
+            ('ok', 'Bool'),
+        ], outcomes)
+
+    def test_errors_are_isolated(self):
+        outcomes = infer_batch([
+            ['lit', 'Int', 1], BAD_PROGRAM, ['var', 'undefined'], ['bogus']
+        ])
+        self.assertEqual(('ok', 'Int'), outcomes[0])
+        self.assertEqual(['error'] * 3, [status for (status, _) in outcomes[1:]])
+
+    def test_malformed_programs_are_isolated(self):
+        deep = ['lit', 'Int', 1]
+        for _ in range(5000):
+            deep = ['lambda', ['x'], deep]
+        outcomes = infer_batch([
+            ['let', [['a']], ['var', 'a']],
+            ['lit', 'Int', 1],
+            ['lambda', 5, ['var', 'x']],
+            deep,
+        ])
+        self.assertEqual(('ok', 'Int'), outcomes[1])
+        self.assertEqual(
+            ['error'] * 3,
+            [status for (status, _) in outcomes[:1] + outcomes[2:]]
+        )
+
+    def test_single_program_type_error(self):
+        outcomes = infer_batch([BAD_PROGRAM])
+        self.assertEqual(['error'], [status for (status, _) in outcomes])
+
+    def test_timeout(self):
+        outcomes = infer_batch([ID_PROGRAM, ['bogus']], timeout=-1)
+        self.assertEqual('timeout', outcomes[0][0])
+        self.assertEqual('error', outcomes[1][0])
+
+    def test_retries_share_the_deadline(self):
+        programs = [['lit', 'Int', 1], BAD_PROGRAM, ['lit', 'Int', 2]]
+        with unittest.mock.patch('server.time', SteppingClock(4)):
+            outcomes = infer_batch(programs, timeout=10)
+        self.assertEqual(('ok', 'Int'), outcomes[0])
+        self.assertEqual(['timeout'] * 2, [status for (status, _) in outcomes[1:]])
+
+class InferenceServerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_handles_request(self):
+        server = InferenceServer()
+        response = await server.handle({'id': 7, 'expr': ID_PROGRAM})
+        self.assertEqual(7, response['id'])
+        self.assertEqual('String', response['type'])
+        self.assertGreaterEqual(response['latency_ms'], 0)
+
+    async def test_batches_concurrent_requests(self):
+        server = InferenceServer(batch_window=0.05)
+        responses = await asyncio.gather(*[
+            server.handle({'id': i, 'expr': ['lit', 'Int', i]})
+            for i in range(10)
+        ])
+        self.assertEqual(['Int'] * 10, [r['type'] for r in responses])
+        self.assertEqual(1, server.stats['batches'])
+
+    async def test_max_batch_size(self):
+        server = InferenceServer(batch_window=10, max_batch=2)
+        responses = await asyncio.gather(*[
+            server.handle({'id': i, 'expr': ['lit', 'Int', i]})
+            for i in range(4)
+        ])
+        self.assertEqual(4, len(responses))
+        self.assertEqual(2, server.stats['batches'])
+
+    async def test_caches_results(self):
+        server = InferenceServer()
+        await server.handle({'id': 1, 'expr': ID_PROGRAM})
+        response = await server.handle({'id': 2, 'expr': ID_PROGRAM})
+        self.assertEqual('String', response['type'])
+        self.assertEqual(1, server.stats['cache_hits'])
+        self.assertEqual(1, server.stats['batches'])
+
+    async def test_reports_errors(self):
+        server = InferenceServer()
+        self.assertIn('error', await server.handle({'id': 1, 'expr': BAD_PROGRAM}))
+        self.assertIn('error', await server.handle({'id': 2}))
+        self.assertIn('error', await server.handle_line(b'not json'))
+
+    async def test_type_errors_are_cached(self):
+        server = InferenceServer()
+        await server.handle({'id': 1, 'expr': BAD_PROGRAM})
+        response = await server.handle({'id': 2, 'expr': BAD_PROGRAM})
+        self.assertIn('error', response)
+        self.assertEqual(1, server.stats['cache_hits'])
+
+    async def test_timeouts_arent_cached(self):
+        server = InferenceServer(timeout=-1)
+        response = await server.handle({'id': 1, 'expr': ID_PROGRAM})
+        self.assertIn('deadline passed', response['error'])
+        await server.handle({'id': 2, 'expr': ID_PROGRAM})
+        self.assertEqual(0, server.stats['cache_hits'])
+
+    async def test_failed_batches_arent_cached(self):
+        server = InferenceServer(executor=BrokenExecutor())
+        response = await server.handle({'id': 1, 'expr': ['lit', 'Int', 1]})
+        self.assertEqual('worker died', response['error'])
+        server._executor = None
+        response = await server.handle({'id': 2, 'expr': ['lit', 'Int', 1]})
+        self.assertEqual('Int', response['type'])
+        self.assertEqual(0, server.stats['cache_hits'])
+
+    async def test_serves_json_lines(self):
+        server = InferenceServer()
+        reader = asyncio.StreamReader()
+        reader.feed_data(json.dumps({'id': 1, 'expr': ID_PROGRAM}).encode())
+        reader.feed_data(b'\n\n')
+        reader.feed_data(b'{"id": 2, "expr": ["lit", "Bool", true]}\n')
+        reader.feed_eof()
+        writer = CollectingWriter()
+
+        await server.serve(reader, writer)
+
+        types = {r['id']: r['type'] for r in writer.lines}
+        self.assertEqual({1: 'String', 2: 'Bool'}, types)
+
+    async def test_closes_socket_connections(self):
+        server = InferenceServer()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'server.sock')
+            unix_server = await asyncio.start_unix_server(server.serve, path=path)
+            async with unix_server:
+                reader, writer = await asyncio.open_unix_connection(path)
+                writer.write(b'{"id": 1, "expr": ["lit", "Int", 1]}\n')
+                writer.write_eof()
+                data = await asyncio.wait_for(reader.read(), timeout=5)
+                writer.close()
+                await writer.wait_closed()
+        self.assertEqual('Int', json.loads(data)['type'])
+
+if __name__ == '__main__':
+    unittest.main()
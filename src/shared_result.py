@@ -0,0 +1,277 @@
+''' Shares a solved Result between processes through shared memory.
+
+share_result copies a Result into one flat, read-only block that any
+number of processes can attach to with SharedResult.attach, instead of
+each getting its own pickled copy of the dicts. The block is a list of
+native-endian 64 bit words followed by two string tables:
+
+    header        MAGIC, n_ids, n_subs, n_cons, n_term_words,
+                  id_bytes, con_bytes
+    id offsets    n_ids + 1 offsets into the ID strings
+    reps          for each ID, the index of the ID that replaced it
+    term offsets  n_ids + 1 offsets into the terms
+    con offsets   n_cons + 1 offsets into the constructor strings
+    terms         for each ID with a type, the constructor's index
+                  times two (plus one if the type is a tuple), then
+                  the index of each of the type's arguments
+    ID strings    every ID, encoded and sorted so they can be searched
+    con strings   every type constructor
+
+IDs must be ints or strings.
+'''
+
+import bisect
+import collections.abc
+import struct
+import sys
+import threading
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+
+from infer import TypeLookup
+
+MAGIC = 0x3153455259505954
+_HEADER = struct.Struct('=7Q')
+_WORD = 8
+
+def share_result(result, name=None):
+    ''' Copies `result` into a new block of shared memory and returns
+    the SharedMemory. The caller owns the block, and should close and
+    unlink it once every reader is done with it. '''
+    ids = set(result.types) | set(result.subs) | set(result.subs.values())
+    cons = set()
+    for t in result.types.values():
+        if isinstance(t, tuple):
+            cons.add(t[0])
+            ids.update(t[1:])
+        else:
+            cons.add(t)
+
+    encoded_ids = sorted(_encode_id(i) for i in ids)
+    index_of = {_decode_id(e): n for (n, e) in enumerate(encoded_ids)}
+    con_names = sorted(cons)
+    con_index = {con: n for (n, con) in enumerate(con_names)}
+
+    reps = []
+    term_offsets = [0]
+    terms = []
+    for encoded in encoded_ids:
+        expr_id = _decode_id(encoded)
+        reps.append(index_of[result.subs.get(expr_id, expr_id)])
+        t = result.types.get(expr_id)
+        if isinstance(t, tuple):
+            terms.append(con_index[t[0]] * 2 + 1)
+            terms.extend(index_of[arg] for arg in t[1:])
+        elif t is not None:
+            terms.append(con_index[t] * 2)
+        term_offsets.append(len(terms))
+
+    id_offsets, id_blob = _string_table(encoded_ids)
+    con_offsets, con_blob = _string_table(con.encode() for con in con_names)
+    header = [
+        MAGIC, len(encoded_ids), len(result.subs), len(con_names),
+        len(terms), len(id_blob), len(con_blob),
+    ]
+    words = header + id_offsets + reps + term_offsets + con_offsets + terms
+    data = struct.pack('={}Q'.format(len(words)), *words) + id_blob + con_blob
+
+    shm = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    shm.buf[:len(data)] = data
+    return shm
+
+_attach_lock = threading.Lock()
+
+def _attach_untracked(name):
+    ''' Attaches to a block without registering it with this process's
+    resource tracker, which would otherwise unlink it for everyone when
+    this process exits. Before 3.13 there is no way to ask for that, so
+    registration is switched off while attaching. (Unregistering after
+    attaching isn't enough: processes started by multiprocessing share
+    the owner's tracker, and that would drop the owner's registration.)
+
+    Since the switch is process-wide, attaching must not happen while
+    another thread in this process creates shared memory, or that block
+    would go untracked too. '''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with _attach_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+def _encode_id(expr_id):
+    if isinstance(expr_id, bool) or not isinstance(expr_id, (int, str)):
+        raise Exception('can\'t share ID {!r}'.format(expr_id))
+    prefix = 'i' if isinstance(expr_id, int) else 's'
+    return (prefix + str(expr_id)).encode()
+
+def _decode_id(encoded):
+    text = encoded.decode()
+    return int(text[1:]) if text[0] == 'i' else text[1:]
+
+def _string_table(strings):
+    offsets = [0]
+    blob = bytearray()
+    for s in strings:
+        blob += s
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+class SharedResult(TypeLookup):
+    ''' A read-only view of a Result written by share_result. Nothing
+    is copied out of the buffer except the constructor names, so
+    attaching is cheap no matter how large the result is. '''
+
+    def __init__(self, buf):
+        self._source = memoryview(buf)
+        self._buf = self._source.toreadonly()
+        (magic, n_ids, n_subs, n_cons, n_term_words,
+         id_bytes, con_bytes) = _HEADER.unpack_from(self._buf)
+        if magic != MAGIC:
+            raise Exception('buffer does not hold a shared result')
+
+        self._views = []
+        offset = _HEADER.size
+        self._id_offsets, offset = self._words(offset, n_ids + 1)
+        self._reps, offset = self._words(offset, n_ids)
+        self._term_offsets, offset = self._words(offset, n_ids + 1)
+        con_offsets, offset = self._words(offset, n_cons + 1)
+        self._terms, offset = self._words(offset, n_term_words)
+        self._id_blob = self._view(offset, id_bytes)
+        con_blob = self._buf[offset + id_bytes:offset + id_bytes + con_bytes]
+        self._cons = [
+            bytes(con_blob[con_offsets[i]:con_offsets[i + 1]]).decode()
+            for i in range(n_cons)
+        ]
+        con_blob.release()
+
+        self._n_ids = n_ids
+        self.types = _SharedTypes(self)
+        self.subs = _SharedSubs(self, n_subs)
+        self._shm = None
+
+    @classmethod
+    def attach(cls, name):
+        ''' Attaches to the shared memory block called `name`. Only the
+        process that created the block unlinks it. Before Python 3.13,
+        don't call this while other threads create shared memory. '''
+        shm = _attach_untracked(name)
+        shared = cls(shm.buf)
+        shared._shm = shm
+        return shared
+
+    def __repr__(self):
+        return 'SharedResult(ids={}, subs={})'.format(
+            self._n_ids, len(self.subs)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        ''' Releases the buffer (and detaches from the shared memory, if
+        this was attached to it). The result can't be used after this. '''
+        for view in self._views:
+            view.release()
+        self._buf.release()
+        self._source.release()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
+
+    def _words(self, offset, count):
+        view = self._view(offset, count * _WORD).cast('Q')
+        self._views.append(view)
+        return view, offset + count * _WORD
+
+    def _view(self, offset, length):
+        view = self._buf[offset:offset + length]
+        self._views.append(view)
+        return view
+
+    def _id_at(self, index):
+        start, end = self._id_offsets[index], self._id_offsets[index + 1]
+        return _decode_id(bytes(self._id_blob[start:end]))
+
+    def _index_of(self, expr_id):
+        try:
+            encoded = _encode_id(expr_id)
+        except Exception:
+            return None
+        index = bisect.bisect_left(_IdKeys(self), encoded)
+        if index < self._n_ids and self._encoded_at(index) == encoded:
+            return index
+        return None
+
+    def _encoded_at(self, index):
+        start, end = self._id_offsets[index], self._id_offsets[index + 1]
+        return bytes(self._id_blob[start:end])
+
+    def _type_at(self, index):
+        start, end = self._term_offsets[index], self._term_offsets[index + 1]
+        if start == end:
+            return None
+        head = self._terms[start]
+        con = self._cons[head // 2]
+        if head % 2 == 0:
+            return con
+        args = [self._id_at(self._terms[i]) for i in range(start + 1, end)]
+        return tuple([con] + args)
+
+class _IdKeys(collections.abc.Sequence):
+    ''' The sorted, encoded IDs, for bisect. '''
+
+    def __init__(self, shared):
+        self._shared = shared
+
+    def __len__(self):
+        return self._shared._n_ids
+
+    def __getitem__(self, index):
+        return self._shared._encoded_at(index)
+
+class _SharedTypes(collections.abc.Mapping):
+    def __init__(self, shared):
+        self._shared = shared
+
+    def __getitem__(self, expr_id):
+        index = self._shared._index_of(expr_id)
+        t = None if index is None else self._shared._type_at(index)
+        if t is None:
+            raise KeyError(expr_id)
+        return t
+
+    def __iter__(self):
+        shared = self._shared
+        for index in range(shared._n_ids):
+            if shared._term_offsets[index] != shared._term_offsets[index + 1]:
+                yield shared._id_at(index)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+class _SharedSubs(collections.abc.Mapping):
+    def __init__(self, shared, size):
+        self._shared = shared
+        self._size = size
+
+    def __getitem__(self, expr_id):
+        index = self._shared._index_of(expr_id)
+        if index is None or self._shared._reps[index] == index:
+            raise KeyError(expr_id)
+        return self._shared._id_at(self._shared._reps[index])
+
+    def __iter__(self):
+        shared = self._shared
+        for index in range(shared._n_ids):
+            if shared._reps[index] != index:
+                yield shared._id_at(index)
+
+    def __len__(self):
+        return self._size
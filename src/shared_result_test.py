@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import concurrent.futures
+import os
+import subprocess
+import sys
+import unittest
+
+from infer import Rules
+from shared_result import SharedResult, share_result
+
+def full_types_in_worker(name, ids):
+    with SharedResult.attach(name) as shared:
+        return [shared.get_full_type_by_id(expr_id) for expr_id in ids]
+
+class SharedResultTest(unittest.TestCase):
+    def setUp(self):
+        self.result = (
+            Rules()
+            .specify(1, ('Pair', 11, 12)).specify(11, 'Int')
+            .equal(12, 13).equal(2, 1)
+            .specify('global_x', ('List', 'global_x.a'))
+            .equal(3, 'global_x')
+            .infer()
+        )
+        self.shm = share_result(self.result)
+        self.addCleanup(self.shm.unlink)
+        self.addCleanup(self.shm.close)
+
+    def all_ids(self):
+        return sorted(
+            set(self.result.types) | set(self.result.subs) | {99, 'missing'},
+            key=str
+        )
+
+    def test_matches_result(self):
+        with SharedResult(self.shm.buf) as shared:
+            self.assertEqual(dict(self.result.types), dict(shared.types))
+            self.assertEqual(dict(self.result.subs), dict(shared.subs))
+            for expr_id in self.all_ids():
+                self.assertEqual(self.result.get_type_by_id(expr_id),
+                                 shared.get_type_by_id(expr_id))
+                self.assertEqual(self.result.get_full_type_by_id(expr_id),
+                                 shared.get_full_type_by_id(expr_id))
+
+    def test_attach_by_name(self):
+        with SharedResult.attach(self.shm.name) as shared:
+            self.assertEqual(('Pair', 'Int', 'a0'), shared.get_full_type_by_id(2))
+            self.assertEqual(('List', 'a0'), shared.get_full_type_by_id(3))
+
+    def test_workers_share_one_copy(self):
+        ids = self.all_ids()
+        expected = [self.result.get_full_type_by_id(i) for i in ids]
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            futures = [
+                executor.submit(full_types_in_worker, self.shm.name, ids)
+                for _ in range(4)
+            ]
+            for future in futures:
+                self.assertEqual(expected, future.result())
+
+    def test_unrelated_reader_leaves_the_block(self):
+        reader = (
+            'from shared_result import SharedResult\n'
+            'with SharedResult.attach({!r}) as shared:\n'
+            '    print(shared.get_full_type_by_id(2))\n'
+        ).format(self.shm.name)
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        completed = subprocess.run(
+            [sys.executable, '-c', reader], cwd=src_dir,
+            capture_output=True, text=True, check=True
+        )
+        self.assertEqual("('Pair', 'Int', 'a0')\n", completed.stdout)
+        self.assertEqual('', completed.stderr)
+        with SharedResult.attach(self.shm.name) as shared:
+            self.assertEqual('Int', shared.get_type_by_id(11))
+
+    def test_readers_cant_write(self):
+        with SharedResult.attach(self.shm.name) as shared:
+            with self.assertRaises(TypeError):
+                shared._buf[0] = 0
+            with self.assertRaises(TypeError):
+                shared._reps[0] = 0
+        with SharedResult(self.shm.buf) as shared:
+            self.assertEqual('Int', shared.get_type_by_id(11))
+
+    def test_rejects_other_buffers(self):
+        with self.assertRaises(Exception):
+            SharedResult(bytes(64))
+
+    def test_rejects_unsupported_ids(self):
+        with self.assertRaises(Exception):
+            share_result(Rules().specify((1, 2), 'Int').infer())
+
+if __name__ == '__main__':
+    unittest.main()
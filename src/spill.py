@@ -0,0 +1,286 @@
+''' Storage for solving rules that don't fit in memory. A SqliteStore
+keeps the rules, the solver's equality work list and the types and
+substitutions in a SQLite file, holding only a bounded number of items
+in memory at a time. '''
+
+import collections
+import os
+import pickle
+import sqlite3
+import tempfile
+from collections.abc import MutableMapping
+
+def _dumps(item):
+    return pickle.dumps(item, 4)
+
+_loads = pickle.loads
+
+class SqliteStore:
+    def __init__(self, path=None, cache_size=10000):
+        self._owned_path = None
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.sqlite')
+            os.close(fd)
+            self._owned_path = path
+        self.path = path
+        self.cache_size = cache_size
+        self._connection = sqlite3.connect(path)
+        # The file is scratch space, so durability doesn't matter
+        self._connection.execute('PRAGMA journal_mode = OFF')
+        self._connection.execute('PRAGMA synchronous = OFF')
+        self._next_table = 0
+
+    def __repr__(self):
+        return 'SqliteStore({!r}, cache_size={})'.format(
+            self.path, self.cache_size
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+        if self._owned_path is not None:
+            os.remove(self._owned_path)
+            self._owned_path = None
+
+    def mapping(self, items=()):
+        mapping = SpilledDict(self)
+        mapping.update(items)
+        return mapping
+
+    def sequence(self):
+        return SpilledList(self)
+
+    def stack(self, items=()):
+        stack = SpilledStack(self)
+        stack.extend(items)
+        return stack
+
+    def _create_table(self, kind, columns):
+        name = '{}_{}'.format(kind, self._next_table)
+        self._next_table += 1
+        self._connection.execute('CREATE TABLE {} {}'.format(name, columns))
+        return name
+
+    def _execute(self, sql, params=()):
+        return self._connection.execute(sql, params)
+
+    def _executemany(self, sql, params):
+        return self._connection.executemany(sql, params)
+
+class SpilledDict(MutableMapping):
+    ''' A dict stored in SQLite. The most recently used items are cached
+    in memory, and changes are only written when they leave the cache. '''
+
+    def __init__(self, store):
+        self._store = store
+        self._table = store._create_table(
+            'dict', '(key BLOB PRIMARY KEY, value BLOB)'
+        )
+        self._cache = collections.OrderedDict()
+        self._dirty = set()
+
+    def __repr__(self):
+        return 'SpilledDict({})'.format(dict(self.items()))
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        row = self._store._execute(
+            'SELECT value FROM {} WHERE key = ?'.format(self._table),
+            (_dumps(key),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        value = _loads(row[0])
+        self._cache_item(key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._cache_item(key, value)
+        self._dirty.add(key)
+
+    def __delitem__(self, key):
+        in_cache = key in self._cache
+        self._cache.pop(key, None)
+        self._dirty.discard(key)
+        cursor = self._store._execute(
+            'DELETE FROM {} WHERE key = ?'.format(self._table), (_dumps(key),)
+        )
+        if not in_cache and cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    def __len__(self):
+        self.flush()
+        return self._store._execute(
+            'SELECT COUNT(*) FROM {}'.format(self._table)
+        ).fetchone()[0]
+
+    def items(self):
+        ''' Reads straight from the table, so iterating doesn't push
+        everything through the cache. '''
+        self.flush()
+        cursor = self._store._execute(
+            'SELECT key, value FROM {}'.format(self._table)
+        )
+        for key, value in cursor:
+            yield _loads(key), _loads(value)
+
+    def flush(self):
+        self._write([(key, self._cache[key]) for key in self._dirty])
+        self._dirty.clear()
+
+    def _cache_item(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._store.cache_size:
+            old_key, old_value = self._cache.popitem(last=False)
+            if old_key in self._dirty:
+                self._dirty.remove(old_key)
+                self._write([(old_key, old_value)])
+
+    def _write(self, items):
+        self._store._executemany(
+            'INSERT OR REPLACE INTO {} VALUES (?, ?)'.format(self._table),
+            [(_dumps(key), _dumps(value)) for (key, value) in items]
+        )
+
+class SpilledList:
+    ''' The SQLite version of infer.SharedList. A fork refers to the
+    rows that existed in its parent's tables when it was forked. '''
+
+    def __init__(self, store, prefix=()):
+        self._store = store
+        # (table, last row ID) pairs that this list starts with
+        self._prefix = prefix
+        self._table = store._create_table('list', '(item BLOB)')
+        self._buffer = []
+
+    def __repr__(self):
+        return 'SpilledList({})'.format(list(self))
+
+    def __iter__(self):
+        for table, last_row in self._segments():
+            cursor = self._store._execute(
+                'SELECT item FROM {} WHERE rowid <= ? ORDER BY rowid'
+                .format(table), (last_row,)
+            )
+            for (item,) in cursor:
+                yield _loads(item)
+
+    def __reversed__(self):
+        for table, last_row in self._segments()[::-1]:
+            cursor = self._store._execute(
+                'SELECT item FROM {} WHERE rowid <= ? ORDER BY rowid DESC'
+                .format(table), (last_row,)
+            )
+            for (item,) in cursor:
+                yield _loads(item)
+
+    def __len__(self):
+        return sum(
+            self._store._execute(
+                'SELECT COUNT(*) FROM {} WHERE rowid <= ?'.format(table),
+                (last_row,)
+            ).fetchone()[0]
+            for (table, last_row) in self._segments()
+        )
+
+    def append(self, item):
+        self._buffer.append((_dumps(item),))
+        if len(self._buffer) >= self._store.cache_size:
+            self._flush()
+
+    def fork(self):
+        return SpilledList(self._store, self._segments())
+
+    def _segments(self):
+        self._flush()
+        last_row = self._store._execute(
+            'SELECT MAX(rowid) FROM {}'.format(self._table)
+        ).fetchone()[0]
+        return self._prefix + ((self._table, last_row or 0),)
+
+    def _flush(self):
+        if self._buffer:
+            self._store._executemany(
+                'INSERT INTO {} VALUES (?)'.format(self._table), self._buffer
+            )
+            self._buffer = []
+
+class SpilledStack:
+    ''' A work list that keeps the top of the stack in memory and moves
+    the bottom of it to SQLite when it grows too large. '''
+
+    def __init__(self, store):
+        self._store = store
+        self._table = store._create_table(
+            'stack', '(position INTEGER PRIMARY KEY, item BLOB)'
+        )
+        self._top = []
+        self._spilled = 0
+
+    def __repr__(self):
+        return 'SpilledStack({})'.format(list(self))
+
+    def __len__(self):
+        return self._spilled + len(self._top)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        ''' Iterates from the bottom of the stack to the top. '''
+        cursor = self._store._execute(
+            'SELECT item FROM {} ORDER BY position'.format(self._table)
+        )
+        for (item,) in cursor:
+            yield _loads(item)
+        yield from list(self._top)
+
+    def append(self, item):
+        self._top.append(item)
+        cache_size = self._store.cache_size
+        if len(self._top) > 2 * cache_size:
+            bottom, self._top = self._top[:cache_size], self._top[cache_size:]
+            self._store._executemany(
+                'INSERT INTO {} VALUES (?, ?)'.format(self._table),
+                [(self._spilled + i, _dumps(item))
+                 for (i, item) in enumerate(bottom)]
+            )
+            self._spilled += len(bottom)
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def pop(self):
+        if not self._top and self._spilled:
+            start = max(0, self._spilled - self._store.cache_size)
+            cursor = self._store._execute(
+                'SELECT item FROM {} WHERE position >= ? ORDER BY position'
+                .format(self._table), (start,)
+            )
+            self._top = [_loads(item) for (item,) in cursor]
+            self._store._execute(
+                'DELETE FROM {} WHERE position >= ?'.format(self._table),
+                (start,)
+            )
+            self._spilled = start
+        return self._top.pop()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+from expression import Application
+from expression import If
+from expression import Lambda
+from expression import Let
+from expression import Literal
+from expression import Variable
+from infer import Rules, Registry, InferenceError
+from spill import SpilledDict, SqliteStore
+
+class SpillTest(unittest.TestCase):
+    def setUp(self):
+        # A tiny cache makes sure everything goes through the database
+        self._store = SqliteStore(cache_size=2)
+
+    def tearDown(self):
+        self._store.close()
+
+    def test_mapping(self):
+        mapping = self._store.mapping({1: 'Int', 'x': ('Pair', 1, 2)})
+        for i in range(10):
+            mapping[i + 100] = i
+        mapping[1] = 'Float'
+        del mapping[100]
+        self.assertEqual('Float', mapping[1])
+        self.assertEqual(('Pair', 1, 2), mapping['x'])
+        self.assertEqual(11, len(mapping))
+        self.assertNotIn(100, mapping)
+        self.assertEqual(None, mapping.get(100))
+        with self.assertRaises(KeyError):
+            del mapping[100]
+        expected = {i + 100: i for i in range(1, 10)}
+        expected.update({1: 'Float', 'x': ('Pair', 1, 2)})
+        self.assertEqual(expected, dict(mapping.items()))
+        self.assertEqual(mapping, expected)
+
+    def test_sequence_forks(self):
+        items = self._store.sequence()
+        for i in range(5):
+            items.append(i)
+        forked = items.fork()
+        items.append(5)
+        forked.append(6)
+        self.assertEqual([0, 1, 2, 3, 4, 5], list(items))
+        self.assertEqual([0, 1, 2, 3, 4, 6], list(forked))
+        self.assertEqual([6, 4, 3, 2, 1, 0], list(reversed(forked)))
+        self.assertEqual(6, len(forked))
+
+    def test_stack(self):
+        stack = self._store.stack(range(10))
+        stack.append(10)
+        self.assertEqual(list(range(11)), list(stack))
+        popped = [stack.pop() for _ in range(6)]
+        stack.extend([20, 21])
+        self.assertEqual([10, 9, 8, 7, 6, 5], popped)
+        self.assertEqual([21, 20, 4, 3, 2, 1, 0],
+                         [stack.pop() for _ in range(7)])
+        self.assertFalse(stack)
+        with self.assertRaises(IndexError):
+            stack.pop()
+
+    def test_spilled_inference_matches_memory(self):
+        ''' ML code:
+        let id = \\x -> x
+            f = \\y -> if y then id 1 else 2
+        in f (id True)
+        '''
+        def program():
+            f_body = If(Variable('y'),
+                        Application(Variable('id'), [Literal('Int', 1)]),
+                        Literal('Int', 2))
+            return Let([('id', Lambda(['x'], Variable('x'))),
+                        ('f', Lambda(['y'], f_body))],
+                       Application(Variable('f'), [
+                           Application(Variable('id'), [Literal('Bool', True)])
+                       ]))
+
+        rules, registry = Rules(), Registry()
+        program().add_to_rules(rules, registry)
+        spilled_rules, spilled_registry = Rules(store=self._store), Registry()
+        let_id = program().add_to_rules(spilled_rules, spilled_registry)
+
+        expected, actual = rules.infer(), spilled_rules.infer()
+        self.assertEqual(expected.types, dict(actual.types.items()))
+        self.assertEqual(expected.subs, dict(actual.subs.items()))
+        self.assertEqual('Int', actual.get_type_by_id(let_id))
+
+    def test_spilled_inference_errors(self):
+        rules = (
+            Rules(store=self._store).specify(1, 'Int').specify(2, 'Bool')
+            .equal(1, 3).equal(3, 2)
+        )
+        with self.assertRaises(InferenceError):
+            rules.infer()
+
+    def test_spilled_forks(self):
+        rules = Rules(store=self._store).specify(1, 'Int')
+        forked = rules.fork().equal(1, 2)
+        self.assertEqual({2: 1}, dict(forked.infer().subs.items()))
+        self.assertEqual({}, dict(rules.infer().subs.items()))
+
+    def test_merges_dont_scan_the_store(self):
+        rules = Rules(store=self._store)
+        for i in range(200):
+            rules.specify(i, ('List', i + 1000)).equal(i, i + 1)
+        scan = unittest.mock.patch.object(
+            SpilledDict, 'items', side_effect=AssertionError('full scan')
+        )
+        with scan:
+            result = rules.infer()
+        self.assertEqual('List', result.get_type_by_id(200)[0])
+        self.assertEqual(result.get_type_by_id(0), result.get_type_by_id(200))
+
+    def test_spilled_occurs_check(self):
+        rules = Rules(store=self._store)
+        for i in range(20):
+            rules.specify(i, ('List', i + 1))
+        solver = rules.equal(20, 5).solver()
+        solver.step(19)
+        # The IDs waiting for the occurs check are kept in the store too
+        self.assertEqual(19, len(solver._touched))
+        self.assertLessEqual(len(solver._touched._top), 4)
+        with self.assertRaisesRegex(InferenceError, 'infinite type'):
+            solver.run()
+
+    def test_spilled_solver_cant_be_checkpointed(self):
+        solver = Rules(store=self._store).specify(1, 'Int').solver()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'solver.ckpt')
+            with self.assertRaisesRegex(Exception, 'store'):
+                solver.save(path)
+            self.assertEqual([], os.listdir(tmp_dir))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from collections import Counter, defaultdict
+
+class TypeIndex:
+    ''' Maps type constructors, and types that have no type variables
+    left in them, to the IDs that have those types. Building the index
+    looks at each ID once; queries after that are dictionary lookups. '''
+
+    def __init__(self, result, ids=None):
+        if ids is None:
+            ids = set(result.types) | set(result.subs)
+        by_con = defaultdict(set)
+        by_ground_type = defaultdict(set)
+        ground_types = {}
+
+        for id_ in ids:
+            type_id = result.subs.get(id_, id_)
+            t = result.types.get(type_id)
+            if t is None:
+                continue
+            by_con[t[0] if isinstance(t, tuple) else t].add(id_)
+            ground_type = self._ground_type(result, type_id, ground_types)
+            if ground_type is not None:
+                by_ground_type[ground_type].add(id_)
+
+        self._by_con = {con: frozenset(ids) for con, ids in by_con.items()}
+        self._by_ground_type = {
+            t: frozenset(ids) for t, ids in by_ground_type.items()
+        }
+
+    def __repr__(self):
+        return 'TypeIndex({})'.format(dict(self.constructor_counts()))
+
+    def ids_with_con(self, type_con):
+        return self._by_con.get(type_con, frozenset())
+
+    def count_with_con(self, type_con):
+        return len(self.ids_with_con(type_con))
+
+    def ids_with_type(self, ground_type):
+        ''' Looks up IDs by a type like ('Fn_1', 'Int', ('List', 'Int')). '''
+        return self._by_ground_type.get(ground_type, frozenset())
+
+    def count_with_type(self, ground_type):
+        return len(self.ids_with_type(ground_type))
+
+    def constructor_counts(self):
+        return Counter({con: len(ids) for con, ids in self._by_con.items()})
+
+    def _ground_type(self, result, type_id, ground_types):
+        ''' Returns the type of `type_id` with every type variable
+        replaced by its type, or None if some variable has no type. '''
+        if type_id in ground_types:
+            return ground_types[type_id]
+        # Marks the type as in progress, so a cyclic type isn't ground
+        ground_types[type_id] = None
+
+        t = result.types.get(type_id)
+        if t is None:
+            ground_type = None
+        elif not isinstance(t, tuple):
+            ground_type = t
+        else:
+            arg_types = [
+                self._ground_type(result, result.subs.get(arg, arg), ground_types)
+                for arg in t[1:]
+            ]
+            if None in arg_types:
+                ground_type = None
+            else:
+                ground_type = tuple([t[0]] + arg_types)
+
+        ground_types[type_id] = ground_type
+        return ground_type
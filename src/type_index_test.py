@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from expression import Application
+from expression import Lambda
+from expression import Let
+from expression import Literal
+from expression import Variable
+from infer import Rules, Registry, Result
+
+class TypeIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._result = (
+            Rules().specify(1, 'Int').equal(1, 2)
+            .specify(3, ('Fn_2', 1, 4, 5)).specify(5, 'Bool')
+            .specify(6, ('Fn_2', 7, 7, 8)).specify(8, 'Int').equal(7, 8)
+            .specify(9, ('List', 10))
+            .infer()
+        )
+        self._index = self._result.build_index()
+
+    def test_finds_ids_by_constructor(self):
+        self.assertEqual({1, 2, 7, 8}, self._index.ids_with_con('Int'))
+        self.assertEqual({3, 6}, self._index.ids_with_con('Fn_2'))
+        self.assertEqual(0, self._index.count_with_con('Float'))
+
+    def test_finds_ids_by_ground_type(self):
+        self.assertEqual({6}, self._index.ids_with_type(
+            ('Fn_2', 'Int', 'Int', 'Int')
+        ))
+        self.assertEqual(4, self._index.count_with_type('Int'))
+        # Types with unknown variables aren't ground
+        self.assertEqual(set(), self._index.ids_with_type(('List', 'Int')))
+        self.assertEqual(1, self._index.count_with_con('List'))
+
+    def test_counts_constructors(self):
+        self.assertEqual(
+            {'Int': 4, 'Bool': 1, 'Fn_2': 2, 'List': 1},
+            self._index.constructor_counts()
+        )
+
+    def test_cyclic_types_arent_ground(self):
+        result = Result({1: ('List', 1)}, {})
+        self.assertEqual({1}, result.build_index().ids_with_con('List'))
+
+    def test_index_registered_expressions(self):
+        ''' ML code:
+        let id = \\x -> x
+        in id 123
+        '''
+        rules, registry = Rules(), Registry()
+        lm = Lambda(['x'], Variable('x'))
+        lit = Literal('Int', 123)
+        var_id = Variable('id')
+        app = Application(var_id, [lit])
+        lt_id = Let([('id', lm)], app).add_to_rules(rules, registry)
+
+        index = rules.infer().build_index(registry.get_registered())
+        self.assertEqual(
+            {lt_id, registry.get_id_for(app), registry.get_id_for(lit)},
+            index.ids_with_con('Int')
+        )
+        self.assertIn(registry.get_id_for(lm), index.ids_with_con('Fn_1'))
+        self.assertEqual({registry.get_id_for(var_id)},
+                         index.ids_with_type(('Fn_1', 'Int', 'Int')))
+
+if __name__ == '__main__':
+    unittest.main()